@@ -0,0 +1,104 @@
+"""bigint ids, thread archive
+
+Revision ID: 7a2d9e4c1b68
+Revises: 3c8e1f7a9d42
+Create Date: 2026-10-17 23:05:41.602118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '7a2d9e4c1b68'
+down_revision: Union[str, None] = '3c8e1f7a9d42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ID_COLUMNS = [
+    ('thread', 'id'),
+    ('post', 'id'),
+    ('post', 'thread'),
+    ('thread_media_file', 'thread'),
+    ('post_media_file', 'post'),
+]
+
+
+def create_thread_summary(**kwargs) -> None:
+    op.create_table('thread_summary',
+    sa.Column('thread', sa.BigInteger(), nullable=False),
+    sa.Column('board', sa.String(length=256), nullable=False),
+    sa.Column('text', sa.Text(), nullable=False),
+    sa.Column('media', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('preview_posts', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('post_count', sa.Integer(), nullable=False),
+    sa.Column('media_count', sa.Integer(), nullable=False),
+    sa.Column('bump_time', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['board'], ['board.slug'], ),
+    sa.ForeignKeyConstraint(['thread'], ['thread.id'], ),
+    **kwargs,
+    )
+    op.create_index('thread_summary_board_bump_time_index', 'thread_summary', ['board', 'bump_time', 'thread'], unique=False)
+
+
+def replace_thread_summary(primary_key, **kwargs) -> None:
+    op.rename_table('thread_summary', 'thread_summary_old')
+    op.execute('ALTER INDEX thread_summary_pkey RENAME TO thread_summary_old_pkey')
+    op.drop_index('thread_summary_board_bump_time_index', table_name='thread_summary_old')
+    op.drop_constraint('thread_summary_board_fkey', 'thread_summary_old', type_='foreignkey')
+    op.drop_constraint('thread_summary_thread_fkey', 'thread_summary_old', type_='foreignkey')
+    create_thread_summary(**kwargs)
+    op.create_primary_key('thread_summary_pkey', 'thread_summary', primary_key)
+    if 'postgresql_partition_by' in kwargs:
+        op.execute('SELECT create_thread_summary_partition(slug) FROM board')
+    op.execute('INSERT INTO thread_summary SELECT * FROM thread_summary_old')
+    op.drop_table('thread_summary_old')
+
+
+def upgrade() -> None:
+    for table, column in ID_COLUMNS:
+        op.alter_column(table, column, existing_type=sa.INTEGER(), type_=sa.BigInteger())
+    op.execute('ALTER TABLE thread ALTER COLUMN id SET NO CYCLE')
+    op.execute('ALTER TABLE post ALTER COLUMN id SET NO CYCLE')
+    op.add_column('thread', sa.Column('archived_at', sa.DateTime(timezone=True), nullable=True))
+
+    op.execute("""
+        CREATE FUNCTION create_thread_summary_partition(board text) RETURNS void AS $$
+        BEGIN
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF thread_summary FOR VALUES IN (%L)',
+                'thread_summary_' || board,
+                board
+            );
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    replace_thread_summary(['thread', 'board'], postgresql_partition_by='LIST (board)')
+    # every board gets its partition, however it is created
+    op.execute("""
+        CREATE FUNCTION board_created() RETURNS trigger AS $$
+        BEGIN
+            PERFORM create_thread_summary_partition(NEW.slug);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER board_created AFTER INSERT ON board
+        FOR EACH ROW EXECUTE FUNCTION board_created()
+    """)
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER board_created ON board')
+    op.execute('DROP FUNCTION board_created()')
+    replace_thread_summary(['thread'])
+    op.execute('DROP FUNCTION create_thread_summary_partition(text)')
+
+    op.drop_column('thread', 'archived_at')
+    op.execute('ALTER TABLE post ALTER COLUMN id SET CYCLE')
+    op.execute('ALTER TABLE thread ALTER COLUMN id SET CYCLE')
+    for table, column in ID_COLUMNS:
+        op.alter_column(table, column, existing_type=sa.BigInteger(), type_=sa.INTEGER())
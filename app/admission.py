@@ -0,0 +1,94 @@
+import collections
+import contextlib
+import math
+import time
+import typing
+
+from app.exceptions import RateLimited
+
+
+class TokenBuckets:
+    """A token bucket per key, refilled at ``rate`` tokens a second up to ``burst``."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        # key -> (tokens, last update), least recently used first
+        self._buckets = collections.OrderedDict()
+
+    def take(self, key) -> float:
+        """Take a token, returns 0 or the seconds until there will be one."""
+        now = time.monotonic()
+        tokens = self._tokens(self._buckets.pop(key, (self.burst, now)), now)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        self._forget_full(now)
+        return retry_after
+
+    def _tokens(self, bucket, now):
+        tokens, updated = bucket
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def _forget_full(self, now):
+        # a bucket that has refilled is the same as a new one
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if self._tokens(bucket, now) < self.burst:
+                break
+            del self._buckets[key]
+
+
+class WriteAdmission:
+    """Decides which writes a worker takes on, before their bodies are read.
+
+    Every client and every board has a token bucket, unless its rate is 0,
+    and at most ``max_in_flight`` writes run at once. Writes over the cap are
+    rejected right away instead of queueing for the db pool and s3. The state
+    is per worker, so the limits are too.
+    """
+
+    def __init__(
+        self,
+        client_rate: float,
+        client_burst: int,
+        board_rate: float,
+        board_burst: int,
+        max_in_flight: int,
+    ):
+        self.clients = TokenBuckets(client_rate, client_burst) if client_rate else None
+        self.boards = TokenBuckets(board_rate, board_burst) if board_rate else None
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+
+    @contextlib.contextmanager
+    def admit(self, client):
+        """Hold a write slot, raises ``RateLimited`` if the write is rejected.
+
+        Only the in-flight cap and the client are checked, they cost nothing.
+        Take from the bucket of the board with ``limit_board`` once it is known.
+        """
+        if self.in_flight >= self.max_in_flight:
+            raise RateLimited(1)
+        if client is not None:
+            self._take(self.clients, client)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    def limit_board(self, board):
+        """Raises ``RateLimited`` if the board takes no more writes for now."""
+        self._take(self.boards, board)
+
+    @staticmethod
+    def _take(buckets: typing.Optional[TokenBuckets], key):
+        if buckets is None:
+            return
+        retry_after = buckets.take(key)
+        if retry_after:
+            raise RateLimited(math.ceil(retry_after))
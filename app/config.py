@@ -1,3 +1,5 @@
+import typing
+
 import pydantic_settings
 
 ALLOWED_MEDIA_EXTENTIONS = {
@@ -14,16 +16,96 @@ class Config(pydantic_settings.BaseSettings):
     postgres_user: str
     postgres_password: str
     postgres_db: str
+    # sqlalchemy uris of streaming replicas that serve the read-only queries
+    db_replica_uris: typing.List[str] = []
+    db_replica_max_lag: float = 5
+    db_replica_check_interval: float = 1
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_recycle: int = -1
+    db_pool_pre_ping: bool = False
+    # set to 0 behind pgbouncer in transaction mode
+    db_statement_cache_size: int = 100
 
     s3_access_key_id: str
     s3_url: str
     s3_secret_access_key: str
+    # endpoint clients use for presigned urls, when it differs from s3_url
+    s3_public_url: typing.Optional[str] = None
+    s3_presigned_url_expires: int = 3600
+    s3_presigned_downloads: bool = False
+    s3_reaper_interval: float = 3600
+    s3_reaper_grace_period: float = 6 * 3600
+    s3_upload_concurrency: int = 4
+    s3_max_concurrent_uploads: int = 32
+    s3_multipart_chunksize: int = 8 * 1024 * 1024
+
+    # bodies over the request limit are aborted while they stream in, files are
+    # checked against their own limit before they are stored
+    upload_max_request_bytes: int = 64 * 1024 * 1024
+    upload_max_image_bytes: int = 10 * 1024 * 1024
+    upload_max_voice_bytes: int = 20 * 1024 * 1024
+
+    thumbnail_size: int = 320
+    thumbnail_workers: typing.Optional[int] = None
+    # values in the waveform of a voice message
+    voice_waveform_peaks: int = 64
+
+    # every process caches up to media_cache_max_bytes in its own subdirectory
+    media_cache_dir: typing.Optional[str] = None
+    media_cache_max_bytes: int = 1024 * 1024 * 1024
+
+    # writes a client may make in a burst, then one every 1 / rate seconds, a
+    # rate of 0 turns the limit off. Clients are told apart by address, run
+    # uvicorn with --proxy-headers behind a proxy.
+    write_client_rate: float = 0.2
+    write_client_burst: int = 5
+    write_board_rate: float = 20
+    write_board_burst: int = 100
+    # writes a worker handles at once, more are rejected right away
+    write_max_in_flight: int = 32
+
+    # background jobs, run by python -m app.worker
+    job_batch_size: int = 16
+    job_poll_interval: float = 1
+    # a job is run again if its worker hasn't finished it by then
+    job_lease: float = 300
+    job_max_attempts: int = 5
+    # the first retry waits this long, every following one twice as long
+    job_retry_delay: float = 10
+    job_retry_max_delay: float = 3600
+
+    boards_refresh_interval: float = 60
+    # threads with this many posts or not bumped for this long are archived
+    archive_bump_limit: int = 500
+    archive_max_age: float = 30 * 24 * 3600
+    archive_interval: float = 60
+    archive_batch_size: int = 1000
+    page_cache_ttl: float = 5
+    page_cache_size: int = 100
+    # serve thread json as encoded by the db, without validating it on the way
+    raw_json_reads: bool = True
+
+    events_check_interval: float = 5
+    # events a slow subscriber may fall behind before it is dropped
+    events_queue_size: int = 100
+    events_keepalive_interval: float = 15
 
     @property
     def db_uri(self):
         # TODO: escape special characters
         return f"postgresql+asyncpg://{self.postgres_user}:{self.postgres_password}@{self.postgres_host}:{self.postgres_port}/{self.postgres_db}"
 
+    @property
+    def db_engine_options(self):
+        return {
+            "pool_size": self.db_pool_size,
+            "max_overflow": self.db_max_overflow,
+            "pool_recycle": self.db_pool_recycle,
+            "pool_pre_ping": self.db_pool_pre_ping,
+            "connect_args": {"statement_cache_size": self.db_statement_cache_size},
+        }
+
     @property
     def allowed_meida_extenions(self):
         return ALLOWED_MEDIA_EXTENTIONS
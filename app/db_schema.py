@@ -1,4 +1,5 @@
 import sqlalchemy
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, TSVECTOR
 
 db_metadata = sqlalchemy.MetaData()
 
@@ -14,8 +15,8 @@ threads_table = sqlalchemy.Table(
     db_metadata,
     sqlalchemy.Column(
         "id",
-        sqlalchemy.Integer,
-        sqlalchemy.Identity(start=1, cycle=True),
+        sqlalchemy.BigInteger,
+        sqlalchemy.Identity(start=1),
         primary_key=True,
     ),
     sqlalchemy.Column("text", sqlalchemy.Text, nullable=False),
@@ -25,20 +26,55 @@ threads_table = sqlalchemy.Table(
         sqlalchemy.ForeignKey(boards_table.columns["slug"]),
     ),
     sqlalchemy.Column("last_update", sqlalchemy.DateTime(timezone=True)),
-    # create last_update_index
+    # set once the thread leaves the board, it stays readable but takes no posts
+    sqlalchemy.Column("archived_at", sqlalchemy.DateTime(timezone=True)),
+    # stemmed words of the text, for search
+    sqlalchemy.Column(
+        "search_vector",
+        TSVECTOR,
+        sqlalchemy.Computed("to_tsvector('russian', text)", persisted=True),
+    ),
+    sqlalchemy.Index("thread_board_last_update_index", "board", "last_update", "id"),
+    sqlalchemy.Index(
+        "thread_search_vector_index", "search_vector", postgresql_using="gin"
+    ),
+)
+
+# uploaded files by content, every attachment of the same content shares one
+media_blobs_table = sqlalchemy.Table(
+    "media_blob",
+    db_metadata,
+    sqlalchemy.Column("key", sqlalchemy.String(256), primary_key=True),
+    sqlalchemy.Column("thumbnail", sqlalchemy.String(256)),
+    # attachments and voice messages of the blob, its files are reaped at zero
+    sqlalchemy.Column("ref_count", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Index("media_blob_thumbnail_index", "thumbnail"),
 )
 
 thread_media_files_table = sqlalchemy.Table(
     "thread_media_file",
     db_metadata,
     sqlalchemy.Column(
-        "thread", sqlalchemy.Integer, sqlalchemy.ForeignKey(threads_table.columns["id"])
+        "id",
+        sqlalchemy.BigInteger,
+        sqlalchemy.Identity(start=1),
+        primary_key=True,
+    ),
+    sqlalchemy.Column(
+        "thread",
+        sqlalchemy.BigInteger,
+        sqlalchemy.ForeignKey(threads_table.columns["id"]),
     ),
     sqlalchemy.Column("filename", sqlalchemy.String(256), nullable=False),
     sqlalchemy.Column(
-        "s3_filename", sqlalchemy.String(256), nullable=False, primary_key=True
+        "s3_filename",
+        sqlalchemy.String(256),
+        sqlalchemy.ForeignKey(media_blobs_table.columns["key"]),
+        nullable=False,
     ),
-    # create thread index
+    sqlalchemy.Column("thumbnail", sqlalchemy.String(256)),
+    sqlalchemy.Index("thread_media_file_thread_index", "thread"),
+    sqlalchemy.Index("thread_media_file_s3_filename_index", "s3_filename"),
 )
 
 posts_table = sqlalchemy.Table(
@@ -46,26 +82,107 @@ posts_table = sqlalchemy.Table(
     db_metadata,
     sqlalchemy.Column(
         "id",
-        sqlalchemy.Integer,
-        sqlalchemy.Identity(start=1, cycle=True),
+        sqlalchemy.BigInteger,
+        sqlalchemy.Identity(start=1),
         primary_key=True,
     ),
     sqlalchemy.Column(
-        "thread", sqlalchemy.Integer, sqlalchemy.ForeignKey(threads_table.columns["id"])
+        "thread",
+        sqlalchemy.BigInteger,
+        sqlalchemy.ForeignKey(threads_table.columns["id"]),
     ),
-    sqlalchemy.Column("voice_message", sqlalchemy.String(256), nullable=False),
-    # create thread index
+    sqlalchemy.Column(
+        "voice_message",
+        sqlalchemy.String(256),
+        sqlalchemy.ForeignKey(media_blobs_table.columns["key"]),
+        nullable=False,
+    ),
+    # read from the mp3 on upload, null if it has no frames
+    sqlalchemy.Column("voice_duration", sqlalchemy.Float),
+    sqlalchemy.Column("voice_bitrate", sqlalchemy.Integer),
+    sqlalchemy.Column("voice_waveform", ARRAY(sqlalchemy.SmallInteger)),
+    sqlalchemy.Index("post_thread_index", "thread", "id"),
+    sqlalchemy.Index("post_voice_message_index", "voice_message"),
 )
 
 post_media_files_table = sqlalchemy.Table(
     "post_media_file",
     db_metadata,
     sqlalchemy.Column(
-        "post", sqlalchemy.Integer, sqlalchemy.ForeignKey(posts_table.columns["id"])
+        "id",
+        sqlalchemy.BigInteger,
+        sqlalchemy.Identity(start=1),
+        primary_key=True,
+    ),
+    sqlalchemy.Column(
+        "post", sqlalchemy.BigInteger, sqlalchemy.ForeignKey(posts_table.columns["id"])
     ),
     sqlalchemy.Column("filename", sqlalchemy.String(256), nullable=False),
     sqlalchemy.Column(
-        "s3_filename", sqlalchemy.String(256), nullable=False, primary_key=True
+        "s3_filename",
+        sqlalchemy.String(256),
+        sqlalchemy.ForeignKey(media_blobs_table.columns["key"]),
+        nullable=False,
+    ),
+    sqlalchemy.Column("thumbnail", sqlalchemy.String(256)),
+    sqlalchemy.Index("post_media_file_post_index", "post"),
+    sqlalchemy.Index("post_media_file_s3_filename_index", "s3_filename"),
+)
+
+# denormalized board listing of the threads that aren't archived, kept up to
+# date by the writes. Partitioned by board, a trigger on board adds the
+# partition of every new board.
+thread_summaries_table = sqlalchemy.Table(
+    "thread_summary",
+    db_metadata,
+    sqlalchemy.Column(
+        "thread",
+        sqlalchemy.BigInteger,
+        sqlalchemy.ForeignKey(threads_table.columns["id"]),
+        primary_key=True,
+    ),
+    sqlalchemy.Column(
+        "board",
+        sqlalchemy.String(256),
+        sqlalchemy.ForeignKey(boards_table.columns["slug"]),
+        primary_key=True,
+    ),
+    sqlalchemy.Column("text", sqlalchemy.Text, nullable=False),
+    sqlalchemy.Column("media", JSONB, nullable=False),
+    # the first posts of the thread, as shown on the board
+    sqlalchemy.Column("preview_posts", JSONB, nullable=False),
+    sqlalchemy.Column("post_count", sqlalchemy.Integer, nullable=False),
+    # media of the thread and all of its posts
+    sqlalchemy.Column("media_count", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("bump_time", sqlalchemy.DateTime(timezone=True), nullable=False),
+    sqlalchemy.Index(
+        "thread_summary_board_bump_time_index", "board", "bump_time", "thread"
+    ),
+    postgresql_partition_by="LIST (board)",
+)
+
+# work done after a write commits, run by the job workers
+jobs_table = sqlalchemy.Table(
+    "job",
+    db_metadata,
+    sqlalchemy.Column(
+        "id",
+        sqlalchemy.BigInteger,
+        sqlalchemy.Identity(start=1),
+        primary_key=True,
+    ),
+    sqlalchemy.Column("kind", sqlalchemy.String(64), nullable=False),
+    # keyword arguments of the handler of the kind
+    sqlalchemy.Column("payload", JSONB, nullable=False),
+    sqlalchemy.Column("attempts", sqlalchemy.Integer, nullable=False),
+    # when the job is due, pushed back while a worker holds it and after failures
+    sqlalchemy.Column("run_at", sqlalchemy.DateTime(timezone=True), nullable=False),
+    # set once the last attempt failed, the job is kept but never run again
+    sqlalchemy.Column("failed_at", sqlalchemy.DateTime(timezone=True)),
+    sqlalchemy.Column("error", sqlalchemy.Text),
+    sqlalchemy.Index(
+        "job_run_at_index",
+        "run_at",
+        postgresql_where=sqlalchemy.text("failed_at IS NULL"),
     ),
-    # create post index
 )
@@ -0,0 +1,106 @@
+import asyncio
+import contextlib
+import json
+import logging
+
+import asyncpg
+
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+# repos notify here inside their write transactions, so only committed writes
+# are delivered
+EVENTS_CHANNEL = "board_events"
+
+
+class EventBus:
+    """Fans the notifications this worker receives out to its subscribers.
+
+    Every event is published to the topic of its board and of its thread.
+    Subscribers that fall ``queue_size`` events behind are dropped, they get
+    ``None`` and should reconnect.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers = {}
+
+    @contextlib.contextmanager
+    def subscribe(self, topic):
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(topic, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            self._unsubscribe(topic, queue)
+
+    def _unsubscribe(self, topic, queue):
+        subscribers = self._subscribers.get(topic, set())
+        subscribers.discard(queue)
+        if not subscribers:
+            self._subscribers.pop(topic, None)
+
+    def publish(self, event):
+        for topic in (board_topic(event["board"]), thread_topic(event["thread"])):
+            for queue in list(self._subscribers.get(topic, ())):
+                if queue.qsize() >= self.queue_size:
+                    self._unsubscribe(topic, queue)
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait(None)
+                else:
+                    queue.put_nowait(event)
+
+
+def board_topic(board):
+    return f"board:{board}"
+
+
+def thread_topic(thread_id):
+    return f"thread:{thread_id}"
+
+
+async def listen_events(resources, interval):
+    """Deliver notifications to ``resources["event_bus"]`` over one connection.
+
+    Also drops the cached pages of boards written to by other workers. The
+    connection is checked every ``interval`` seconds and reopened when lost.
+    Notifications sent while it is down are lost, so every cached page is
+    dropped on reconnect.
+    """
+
+    def on_notification(connection, pid, channel, payload):
+        event = json.loads(payload)
+        resources["page_cache"].invalidate(event["board"])
+        resources["event_bus"].publish(event)
+
+    while True:
+        try:
+            connection = await asyncpg.connect(
+                host=config.postgres_host,
+                port=config.postgres_port,
+                user=config.postgres_user,
+                password=config.postgres_password,
+                database=config.postgres_db,
+            )
+        except Exception:
+            logger.warning("Failed to connect the event listener", exc_info=True)
+            await asyncio.sleep(interval)
+            continue
+        closed = asyncio.Event()
+        connection.add_termination_listener(lambda connection: closed.set())
+        try:
+            await connection.add_listener(EVENTS_CHANNEL, on_notification)
+            resources["page_cache"].clear()
+            while not closed.is_set():
+                try:
+                    await asyncio.wait_for(closed.wait(), interval)
+                except asyncio.TimeoutError:
+                    await connection.execute("SELECT 1", timeout=interval)
+            logger.warning("Event listener disconnected")
+        except Exception:
+            logger.warning("Event listener failed", exc_info=True)
+        finally:
+            connection.terminate()
+        await asyncio.sleep(interval)
@@ -6,9 +6,33 @@ class ThreadNotExists(Exception):
     pass
 
 
+class ThreadArchived(Exception):
+    pass
+
+
 class FileNotExists(Exception):
     pass
 
 
 class FileTypeNotSupported(Exception):
     pass
+
+
+class FileTooLarge(Exception):
+    pass
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class RangeNotSatisfiable(Exception):
+    def __init__(self, size):
+        super().__init__(size)
+        self.size = size
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
@@ -1,26 +1,38 @@
+import asyncio
+import json
 import pathlib
 import typing
 
+import orjson
+import prometheus_client
 import pydantic
 from fastapi import (
+    APIRouter,
     FastAPI,
     Form,
     HTTPException,
+    Query,
+    Request,
     Response,
     UploadFile,
     responses,
     status,
 )
+from fastapi.routing import APIRoute
 
-from app import exceptions
+from app import events, exceptions
 from app.config import config
+from app.metrics import MetricsMiddleware
 from app.repositories import BoardRepo, FileRepo, PostRepo, ThreadRepo
 from app.resources import lifespan, resources
+from app.thumbnails import thumbnail_name
+from app.uploads import BodySizeLimitMiddleware
 
 
 class ThreadMedia(pydantic.BaseModel):
     filename: str
     file_id: str
+    thumbnail: typing.Optional[str] = None
 
 
 class Board(pydantic.BaseModel):
@@ -31,6 +43,12 @@ class Board(pydantic.BaseModel):
 class Post(pydantic.BaseModel):
     id: int
     voice_message: str
+    # seconds
+    voice_duration: typing.Optional[float] = None
+    # kbit/s
+    voice_bitrate: typing.Optional[int] = None
+    # how much sound every stretch of the message carries, 0 to 255
+    voice_waveform: typing.Optional[typing.List[int]] = None
     media: typing.List[ThreadMedia]
 
 
@@ -41,11 +59,45 @@ class Thread(pydantic.BaseModel):
     posts: typing.List[Post]
 
 
+class ThreadPreview(Thread):
+    post_count: int
+    media_count: int
+
+
+class ThreadPage(pydantic.BaseModel):
+    threads: typing.List[ThreadPreview]
+    next: typing.Optional[str]
+
+
+class ThreadMatch(pydantic.BaseModel):
+    id: int
+    text: str
+    media: typing.List[ThreadMedia]
+
+
+class SearchPage(pydantic.BaseModel):
+    threads: typing.List[ThreadMatch]
+    next: typing.Optional[str]
+
+
+class UploadRequest(pydantic.BaseModel):
+    filenames: typing.List[str]
+
+
+class PresignedUpload(pydantic.BaseModel):
+    file_id: str
+    filename: str
+    url: str
+    headers: typing.Dict[str, str]
+
+
 class HTTPError(pydantic.BaseModel):
     detail: str
 
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(BodySizeLimitMiddleware, max_bytes=config.upload_max_request_bytes)
+app.add_middleware(MetricsMiddleware)
 
 thread_repo = ThreadRepo(resources)
 post_repo = PostRepo(resources)
@@ -57,26 +109,131 @@ def error_responses(*codes):
     return {code: {"model": HTTPError} for code in codes}
 
 
+async def write_board(request: Request):
+    """The board a write goes to.
+
+    ``None`` if the thread id is invalid, the handler rejects it then.
+    """
+    if "board" in request.path_params:
+        return request.path_params["board"]
+    try:
+        thread_id = int(request.path_params["thread_id"])
+    except ValueError:
+        return None
+    board = await thread_repo.get_board(thread_id)
+    if board is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Thread not found",
+        )
+    return board
+
+
+class AdmittedRoute(APIRoute):
+    """A write, admitted by ``write_admission`` before its body is read."""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def admitted_handler(request: Request):
+            admission = resources["write_admission"]
+            client = request.client.host if request.client else None
+            try:
+                # the board may take a db lookup, rejected writes shouldn't
+                with admission.admit(client):
+                    board = await write_board(request)
+                    if board is not None:
+                        admission.limit_board(board)
+                    return await handler(request)
+            except exceptions.RateLimited as exc:
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many requests",
+                    headers={"Retry-After": str(exc.retry_after)},
+                )
+
+        return admitted_handler
+
+
+writes = APIRouter(route_class=AdmittedRoute)
+
+
+async def event_stream(topic):
+    """Server-sent events of a topic, with comments keeping the connection open."""
+    with resources["event_bus"].subscribe(topic) as queue:
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    queue.get(), config.events_keepalive_interval
+                )
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            # the subscriber fell behind, the client reconnects and refetches
+            if event is None:
+                return
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def event_stream_response(topic):
+    return responses.StreamingResponse(
+        event_stream(topic),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def encode_raw_thread_page(page):
+    """Encode a page from ``get_threads_json`` as a ``ThreadPage``."""
+    return orjson.dumps({**page, "threads": orjson.Fragment(page["threads"])})
+
+
+def etag_matches(request: Request, etag):
+    if_none_match = request.headers.get("if-none-match", "")
+    return etag in (tag.strip() for tag in if_none_match.split(","))
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(
+        prometheus_client.generate_latest(),
+        media_type=prometheus_client.CONTENT_TYPE_LATEST,
+    )
+
+
 @app.get("/api/v0/board", status_code=200)
 async def get_boards() -> typing.List[Board]:
     return await board_repo.get_boards()
 
 
-@app.post(
+@writes.post(
     "/api/v0/{board}/thread",
     status_code=201,
-    responses=error_responses(400, 404, 419),
+    responses=error_responses(400, 404, 413, 429),
 )
 async def create_thread(
-    board: str, files: typing.List[UploadFile], text: typing.Annotated[str, Form(...)]
+    board: str,
+    text: typing.Annotated[str, Form(...)],
+    files: typing.List[UploadFile] = [],
+    file_ids: typing.Annotated[typing.List[str], Form()] = [],
 ):
     try:
-        await thread_repo.create_thread(board, files, text)
+        await thread_repo.create_thread(board, files, text, file_ids)
     except exceptions.FileTypeNotSupported as exc:
         raise HTTPException(
             status_code=400,
             detail=str(exc),
         )
+    except exceptions.FileNotExists:
+        raise HTTPException(
+            status_code=400,
+            detail="Uploaded file not found",
+        )
+    except exceptions.FileTooLarge as exc:
+        raise HTTPException(
+            status_code=413,
+            detail=str(exc),
+        )
     except exceptions.BoardNotExists:
         raise HTTPException(
             status_code=404,
@@ -85,16 +242,113 @@ async def create_thread(
     return Response(status_code=status.HTTP_201_CREATED)
 
 
-@app.get("/api/v0/{board}/thread", status_code=200, responses=error_responses(404))
-async def get_threads(board: str) -> typing.List[Thread]:
+@app.get(
+    "/api/v0/{board}/thread",
+    status_code=200,
+    response_model=ThreadPage,
+    responses=error_responses(400, 404),
+)
+async def get_threads(
+    request: Request,
+    board: str,
+    limit: typing.Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: typing.Optional[str] = None,
+):
+    page_cache = resources["page_cache"]
+    page = (limit, cursor)
+    cached_page = page_cache.get(board, page)
+    if cached_page is None:
+        version = page_cache.version(board)
+        try:
+            if config.raw_json_reads:
+                threads = await thread_repo.get_threads_json(board, limit, cursor)
+            else:
+                threads = await thread_repo.get_threads(board, limit, cursor)
+        except exceptions.InvalidCursor:
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid cursor",
+            )
+        except exceptions.BoardNotExists:
+            raise HTTPException(
+                status_code=404,
+                detail="Board not found",
+            )
+        if config.raw_json_reads:
+            body = encode_raw_thread_page(threads)
+        else:
+            body = ThreadPage.model_validate(threads).model_dump_json().encode()
+        cached_page = page_cache.set(board, page, body, version)
+
+    etag, body = cached_page
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+@app.get(
+    "/api/v0/{board}/search",
+    status_code=200,
+    response_model=SearchPage,
+    responses=error_responses(400, 404),
+)
+async def search_threads(
+    board: str,
+    q: typing.Annotated[str, Query(min_length=1, max_length=256)],
+    limit: typing.Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: typing.Optional[str] = None,
+):
+    """Threads of a board by their text, the best matches first.
+
+    ``q`` takes "quoted phrases", ``or`` and ``-word``.
+    """
     try:
-        threads = await thread_repo.get_threads(board)
+        return await thread_repo.search_threads(board, q, limit, cursor)
+    except exceptions.InvalidCursor:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid cursor",
+        )
+    except exceptions.BoardNotExists:
+        raise HTTPException(
+            status_code=404,
+            detail="Board not found",
+        )
+
+
+@app.get("/api/v0/{board}/events", responses=error_responses(404))
+async def get_board_events(board: str):
+    """New threads and posts of a board, as server-sent events."""
+    try:
+        board_repo.check_board(board)
     except exceptions.BoardNotExists:
         raise HTTPException(
             status_code=404,
             detail="Board not found",
         )
-    return threads
+    return event_stream_response(events.board_topic(board))
+
+
+@app.get("/api/v0/{board}/thread/{thread_id}/events", responses=error_responses(404))
+async def get_thread_events(board: str, thread_id: int):
+    """New posts of a thread, as server-sent events.
+
+    Fetch them with ``after_post_id`` set to the last post the client has.
+    """
+    try:
+        await thread_repo.check_thread(board, thread_id)
+    except exceptions.BoardNotExists:
+        raise HTTPException(
+            status_code=404,
+            detail="Board not found",
+        )
+    except exceptions.ThreadNotExists:
+        raise HTTPException(
+            status_code=404,
+            detail="Thread not found",
+        )
+    return event_stream_response(events.thread_topic(thread_id))
 
 
 @app.get(
@@ -102,9 +356,24 @@ async def get_threads(board: str) -> typing.List[Thread]:
     status_code=200,
     responses=error_responses(404),
 )
-async def get_thread(board: str, thread_id: int) -> Thread:
+async def get_thread(
+    board: str,
+    thread_id: int,
+    after_post_id: typing.Optional[int] = None,
+    limit: typing.Annotated[int, Query(ge=1, le=500)] = 100,
+    last: bool = False,
+) -> Thread:
     try:
-        thread = await thread_repo.get_thread(board, thread_id)
+        if config.raw_json_reads:
+            return Response(
+                await thread_repo.get_thread_json(
+                    board, thread_id, limit, after_post_id, last
+                ),
+                media_type="application/json",
+            )
+        thread = await thread_repo.get_thread(
+            board, thread_id, limit, after_post_id, last
+        )
     except exceptions.BoardNotExists:
         raise HTTPException(
             status_code=404,
@@ -118,37 +387,135 @@ async def get_thread(board: str, thread_id: int) -> Thread:
     return thread
 
 
-@app.post(
+@writes.post(
     "/api/v0/{thread_id}/post",
     status_code=201,
-    responses=error_responses(400, 404, 419),
+    responses=error_responses(400, 404, 409, 413, 429),
 )
 async def create_post(
-    thread_id: int, files: typing.List[UploadFile], voice: UploadFile
+    thread_id: int,
+    files: typing.List[UploadFile] = [],
+    voice: typing.Optional[UploadFile] = None,
+    file_ids: typing.Annotated[typing.List[str], Form()] = [],
+    voice_id: typing.Annotated[typing.Optional[str], Form()] = None,
 ):
+    if (voice is None) == (voice_id is None):
+        raise HTTPException(
+            status_code=400,
+            detail="Either voice or voice_id is required",
+        )
     try:
-        await post_repo.create_post(thread_id, files, voice)
+        await post_repo.create_post(thread_id, files, voice, file_ids, voice_id)
     except exceptions.FileTypeNotSupported as exc:
         raise HTTPException(
             status_code=400,
             detail=str(exc),
         )
+    except exceptions.FileNotExists:
+        raise HTTPException(
+            status_code=400,
+            detail="Uploaded file not found",
+        )
+    except exceptions.FileTooLarge as exc:
+        raise HTTPException(
+            status_code=413,
+            detail=str(exc),
+        )
     except exceptions.ThreadNotExists:
         raise HTTPException(
             status_code=404,
             detail="Thread not found",
         )
+    except exceptions.ThreadArchived:
+        raise HTTPException(
+            status_code=409,
+            detail="Thread is archived",
+        )
     return Response(status_code=status.HTTP_201_CREATED)
 
 
-@app.get("/api/v0/file/{file_id}", status_code=200, responses=error_responses(404))
-async def downlad_file(file_id: str):
+app.include_router(writes)
+
+
+@app.post("/api/v0/upload", status_code=200, responses=error_responses(400))
+async def create_upload_urls(upload: UploadRequest) -> typing.List[PresignedUpload]:
     try:
-        file_data = await file_repo.download_file(file_id)
+        return await file_repo.create_upload_urls(upload.filenames)
+    except exceptions.FileTypeNotSupported as exc:
+        raise HTTPException(
+            status_code=400,
+            detail=str(exc),
+        )
+
+
+@app.api_route(
+    "/api/v0/file/{file_id}",
+    methods=["GET", "HEAD"],
+    status_code=200,
+    responses=error_responses(404, 416),
+)
+async def downlad_file(
+    request: Request,
+    file_id: str,
+    variant: typing.Optional[typing.Literal["thumb"]] = None,
+):
+    if variant == "thumb":
+        file_id = thumbnail_name(file_id)
+    media_type = config.allowed_extenions.get(pathlib.Path(file_id).suffix[1:])
+    # no file was ever stored under another extension
+    if media_type is None:
+        raise HTTPException(
+            status_code=404,
+            detail="File not found",
+        )
+    # s3 keys are never reused, so the key itself is a strong validator
+    headers = {
+        "ETag": f'"{file_id}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    # a url presigned for GET is rejected on HEAD, HEAD is answered here
+    if config.s3_presigned_downloads and request.method != "HEAD":
+        return responses.RedirectResponse(
+            await file_repo.get_download_url(file_id),
+            status_code=status.HTTP_302_FOUND,
+        )
+
+    cached_file = file_repo.get_cached_file(file_id)
+    if cached_file is not None:
+        return responses.FileResponse(
+            cached_file, headers=headers, media_type=media_type
+        )
+
+    try:
+        if request.method == "HEAD":
+            file_info = await file_repo.get_file_info(file_id)
+            headers["Content-Length"] = str(file_info["content_length"])
+            return Response(headers=headers, media_type=media_type)
+        file_data = await file_repo.download_file(file_id, request.headers.get("range"))
     except exceptions.FileNotExists:
         raise HTTPException(
             status_code=404,
             detail="File not found",
         )
-    media_type = config.allowed_extenions[pathlib.Path(file_id).suffix[1:]]
-    return responses.StreamingResponse(file_data, media_type=media_type)
+    except exceptions.RangeNotSatisfiable as exc:
+        raise HTTPException(
+            status_code=416,
+            detail="Range not satisfiable",
+            headers={"Content-Range": f"bytes */{exc.size}"} if exc.size else None,
+        )
+
+    headers["Content-Length"] = str(file_data["content_length"])
+    status_code = status.HTTP_200_OK
+    if file_data["content_range"]:
+        headers["Content-Range"] = file_data["content_range"]
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+    return responses.StreamingResponse(
+        file_data["body"],
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type,
+    )
@@ -0,0 +1,93 @@
+import asyncio
+import collections
+import os
+import pathlib
+import shutil
+import typing
+import uuid
+
+
+class MediaCache:
+    """Byte-capped LRU of S3 objects on local disk.
+
+    Objects are stored under their S3 key. Keys are never reused, so cached
+    files are never stale and only have to be evicted for space.
+    """
+
+    def __init__(self, directory, max_bytes: int):
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self._files = collections.OrderedDict()
+        self._size = 0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        paths = sorted(self.directory.iterdir(), key=lambda p: p.stat().st_atime)
+        for path in paths:
+            if path.name.startswith("."):
+                path.unlink()
+            else:
+                self._add(path.name, path.stat().st_size)
+        self._evict()
+
+    def get(self, key) -> typing.Optional[pathlib.Path]:
+        if key not in self._files:
+            return None
+        self._files.move_to_end(key)
+        return self.directory / key
+
+    async def fill(self, key, chunks):
+        """Pass ``chunks`` through, storing them once the whole object is read."""
+        tmp_path = self.directory / f".{uuid.uuid4()}"
+        size = 0
+        complete = False
+        try:
+            with open(tmp_path, "wb") as tmp_file:
+                async for chunk in chunks:
+                    await asyncio.to_thread(tmp_file.write, chunk)
+                    size += len(chunk)
+                    yield chunk
+            complete = True
+        finally:
+            if complete and self._cacheable(key) and key not in self._files:
+                os.replace(tmp_path, self.directory / key)
+                self._add(key, size)
+                self._evict()
+            else:
+                tmp_path.unlink(missing_ok=True)
+
+    def _cacheable(self, key):
+        return key == pathlib.Path(key).name and not key.startswith(".")
+
+    def _add(self, key, size):
+        self._files[key] = size
+        self._size += size
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._files:
+            key, size = self._files.popitem(last=False)
+            self._size -= size
+            (self.directory / key).unlink(missing_ok=True)
+
+
+def process_media_cache(directory, max_bytes: int) -> MediaCache:
+    """A cache of this process in its own subdirectory of ``directory``.
+
+    Every process keeps its own index, so processes can't share files. The
+    subdirectories of processes that are gone are removed.
+    """
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for path in directory.iterdir():
+        if path.name.isdigit() and not _process_exists(int(path.name)):
+            shutil.rmtree(path, ignore_errors=True)
+    return MediaCache(directory / str(os.getpid()), max_bytes)
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
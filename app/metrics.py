@@ -0,0 +1,203 @@
+import contextlib
+import contextvars
+import functools
+import time
+
+from prometheus_client import Histogram
+from prometheus_client.core import REGISTRY, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# every observation is a dict lookup and a bucket increment, cheap enough to
+# leave on in production. Labels are bounded: route templates, repo methods,
+# s3 operations and pool names, never raw paths or ids.
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request, until the response is fully sent",
+    ["method", "route", "status"],
+)
+# event streams stay open for as long as their clients watch, they would drown
+# the request latencies
+EVENT_STREAM_DURATION = Histogram(
+    "http_event_stream_duration_seconds",
+    "Time an event stream stayed open",
+    ["route"],
+    buckets=(1, 10, 60, 300, 900, 3600, 4 * 3600, 24 * 3600),
+)
+DB_STATEMENT_LATENCY = Histogram(
+    "db_statement_duration_seconds",
+    "Time spent executing a statement",
+    ["repo_method"],
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the pool",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+S3_CALL_LATENCY = Histogram(
+    "s3_call_duration_seconds",
+    "Time spent in an s3 call",
+    ["operation", "outcome"],
+)
+
+# the repo method that issued a statement; statements issued outside of one
+# (migrations, the replica monitor) are labeled "other"
+repo_method = contextvars.ContextVar("repo_method", default="other")
+
+
+def instrumented(method):
+    """Label the db statements issued by a repo method with its name."""
+    name = method.__qualname__
+
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        token = repo_method.set(name)
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            repo_method.reset(token)
+
+    return wrapper
+
+
+class MetricsMiddleware:
+    """Time every request and label it by the route template it matched.
+
+    Event streams are timed apart from the other requests.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+        event_stream = False
+
+        async def send_wrapper(message):
+            nonlocal status, event_stream
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                event_stream = any(
+                    name.lower() == b"content-type"
+                    and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", ())
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            route_path = route.path if route else "unmatched"
+            if event_stream:
+                EVENT_STREAM_DURATION.labels(route_path).observe(
+                    time.perf_counter() - start
+                )
+            else:
+                REQUEST_LATENCY.labels(scope["method"], route_path, status).observe(
+                    time.perf_counter() - start
+                )
+
+
+class TimedPool(AsyncAdaptedQueuePool):
+    """A queue pool that records how long checkouts wait for a connection.
+
+    The wait includes opening a new connection when the pool has none idle.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.labels(self.logging_name).observe(
+                time.perf_counter() - start
+            )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    DB_STATEMENT_LATENCY.labels(repo_method.get()).observe(
+        time.perf_counter() - context._metrics_start
+    )
+
+
+def instrument_engine(engine):
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    return engine
+
+
+def _before_s3_call(model, context, **kwargs):
+    context["metrics_operation"] = model.name
+    context["metrics_start"] = time.perf_counter()
+
+
+def _after_s3_call(http_response, context, **kwargs):
+    S3_CALL_LATENCY.labels(
+        context["metrics_operation"],
+        "ok" if http_response.status_code < 300 else "error",
+    ).observe(time.perf_counter() - context["metrics_start"])
+
+
+def _after_s3_call_error(context, **kwargs):
+    S3_CALL_LATENCY.labels(context["metrics_operation"], "error").observe(
+        time.perf_counter() - context["metrics_start"]
+    )
+
+
+@contextlib.contextmanager
+def time_s3_operation(operation):
+    """Time a managed transfer, which spans several s3 calls."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        S3_CALL_LATENCY.labels(operation, outcome).observe(time.perf_counter() - start)
+
+
+def instrument_s3_client(client):
+    client.meta.events.register("before-call.s3", _before_s3_call)
+    client.meta.events.register("after-call.s3", _after_s3_call)
+    client.meta.events.register("after-call-error.s3", _after_s3_call_error)
+    return client
+
+
+class PoolCollector:
+    """Reports the in-use and total connections of every engine pool on scrape."""
+
+    def __init__(self, resources):
+        self.resources = resources
+
+    def collect(self):
+        checked_out = GaugeMetricFamily(
+            "db_pool_checked_out_connections",
+            "Connections currently checked out of the pool",
+            labels=["pool"],
+        )
+        size = GaugeMetricFamily(
+            "db_pool_connections",
+            "Connections currently held by the pool",
+            labels=["pool"],
+        )
+        engines = [self.resources["db_engine"], *self.resources["db_replica_engines"]]
+        for engine in engines:
+            pool = engine.pool
+            checked_out.add_metric([pool.logging_name], pool.checkedout())
+            size.add_metric([pool.logging_name], pool.checkedin() + pool.checkedout())
+        yield checked_out
+        yield size
+
+
+def register_pool_collector(resources):
+    REGISTRY.register(PoolCollector(resources))
@@ -0,0 +1,54 @@
+import hashlib
+import time
+
+
+class PageCache:
+    """Encoded board pages, dropped whenever the board is written to.
+
+    Writes handled by other workers arrive through the event listener a bit
+    later, and not at all while it is disconnected, so entries also expire
+    after ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl: float, max_pages: int):
+        self.ttl = ttl
+        self.max_pages = max_pages
+        self._pages = {}
+        self._versions = {}
+        self._invalidated_at = {}
+
+    def version(self, board):
+        return self._versions.get(board, 0)
+
+    def invalidated_within(self, board, seconds) -> bool:
+        """Whether the board was invalidated less than ``seconds`` ago."""
+        invalidated_at = self._invalidated_at.get(board)
+        return (
+            invalidated_at is not None and time.monotonic() - invalidated_at < seconds
+        )
+
+    def get(self, board, page):
+        entry = self._pages.get(board, {}).get(page)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1], entry[2]
+
+    def set(self, board, page, body: bytes, version):
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        # a page read before the latest write to the board must not be cached
+        if version == self.version(board):
+            pages = self._pages.setdefault(board, {})
+            pages.pop(page, None)
+            if len(pages) >= self.max_pages:
+                del pages[next(iter(pages))]
+            pages[page] = (time.monotonic() + self.ttl, etag, body)
+        return etag, body
+
+    def invalidate(self, board):
+        self._versions[board] = self.version(board) + 1
+        self._invalidated_at[board] = time.monotonic()
+        self._pages.pop(board, None)
+
+    def clear(self):
+        for board in {*self._pages, *self._versions}:
+            self.invalidate(board)
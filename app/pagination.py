@@ -0,0 +1,21 @@
+import base64
+import binascii
+import json
+
+from app.exceptions import InvalidCursor
+
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise InvalidCursor
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor
+    return values
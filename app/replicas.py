@@ -0,0 +1,38 @@
+import asyncio
+import logging
+
+import sqlalchemy
+
+logger = logging.getLogger(__name__)
+
+REPLICA_LAG_STMT = sqlalchemy.text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery()
+            OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+    END
+    """)
+
+
+async def get_replica_lag(engine):
+    async with engine.connect() as conn:
+        return (await conn.execute(REPLICA_LAG_STMT)).scalar()
+
+
+async def monitor_replicas(resources, interval, max_lag):
+    """Keep ``resources["db_healthy_replicas"]`` to the replicas that keep up.
+
+    Reads fall back to the primary while no replica is healthy.
+    """
+    while True:
+        healthy_replicas = []
+        for engine in resources["db_replica_engines"]:
+            try:
+                lag = await asyncio.wait_for(get_replica_lag(engine), interval)
+            except Exception:
+                logger.warning("Replica %s is unavailable", engine.url, exc_info=True)
+                continue
+            if lag is not None and lag <= max_lag:
+                healthy_replicas.append(engine)
+        resources["db_healthy_replicas"] = healthy_replicas
+        await asyncio.sleep(interval)
@@ -1,4 +1,5 @@
 from .board_repo import BoardRepo
 from .file_repo import FileRepo
+from .job_repo import JobRepo
 from .post_repo import PostRepo
 from .thread_repo import ThreadRepo
@@ -1,5 +1,53 @@
+import asyncio
+import collections
+import hashlib
+import io
+import logging
+import pathlib
+import random
+import typing
+import urllib.parse
+
+import sqlalchemy
+from botocore.exceptions import ClientError
+from fastapi import UploadFile
+from sqlalchemy.dialects.postgresql import JSONB, insert
 from sqlalchemy.ext.asyncio import AsyncEngine
 
+from app.config import config
+from app.db_schema import jobs_table, media_blobs_table
+from app.events import EVENTS_CHANNEL
+from app.exceptions import (
+    BoardNotExists,
+    FileNotExists,
+    FileTooLarge,
+    FileTypeNotSupported,
+)
+from app.media_cache import MediaCache
+from app.metrics import time_s3_operation
+from app.page_cache import PageCache
+from app.thumbnails import make_thumbnail, thumbnail_name
+from app.uploads import SNIFF_BYTES, max_file_bytes, sniff
+
+logger = logging.getLogger(__name__)
+
+# files are uploaded here first and moved out right before the db references
+# them, whatever is left here or unreferenced outside is reaped
+PENDING_PREFIX = "pending/"
+
+# posts shown with every thread on the board page
+PREVIEW_POSTS = 3
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_hash(fileobj) -> str:
+    """sha256 hex digest of a file, read in chunks from its current position."""
+    digest = hashlib.sha256()
+    while chunk := fileobj.read(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
 
 class Repo:
     def __init__(self, resources):
@@ -9,6 +57,420 @@ class Repo:
     def s3_client(self):
         return self.resources["s3"]
 
+    @property
+    def s3_presign_client(self):
+        return self.resources["s3_presign"]
+
     @property
     def db_engine(self) -> AsyncEngine:
         return self.resources["db_engine"]
+
+    @property
+    def read_db_engine(self) -> AsyncEngine:
+        """A replica that keeps up with the primary, or the primary itself.
+
+        Replicas may miss the latest commits, use this only for reads that can
+        be slightly stale.
+        """
+        return random.choice(self.resources["db_healthy_replicas"] or [self.db_engine])
+
+    @property
+    def media_cache(self) -> typing.Optional[MediaCache]:
+        return self.resources["media_cache"]
+
+    @property
+    def page_cache(self) -> PageCache:
+        return self.resources["page_cache"]
+
+    @property
+    def thread_boards(self) -> dict:
+        return self.resources["thread_boards"]
+
+    @property
+    def boards(self) -> dict:
+        return self.resources["boards"]
+
+    def _check_board(self, board):
+        if board not in self.boards:
+            raise BoardNotExists
+
+    def _check_media_extension(self, filename):
+        file_extension = pathlib.Path(filename).suffix[1:]
+        if file_extension not in config.allowed_meida_extenions:
+            raise FileTypeNotSupported(
+                f"Типы поддерживаемых медиафайлов: {', '.join(config.allowed_meida_extenions)}"
+            )
+        return file_extension
+
+    async def _new_media_file(self, f: UploadFile):
+        file_extension = self._check_media_extension(f.filename)
+        await self._check_upload(f, file_extension)
+        return {
+            "s3_filename": await self._content_key(f, file_extension),
+            "filename": f.filename,
+            "thumbnail": None,
+        }
+
+    @staticmethod
+    def _check_file(file_extension, size, head):
+        """Check the size and the first ``SNIFF_BYTES`` of a file against its type."""
+        media_type = config.allowed_extenions[file_extension]
+        if size > max_file_bytes(media_type):
+            raise FileTooLarge(
+                f"Files of type {file_extension} are limited to "
+                f"{max_file_bytes(media_type)} bytes"
+            )
+        if not sniff(head, media_type):
+            raise FileTypeNotSupported(f"File content is not {file_extension}")
+
+    async def _check_upload(self, f: UploadFile, file_extension):
+        head = await f.read(SNIFF_BYTES)
+        await f.seek(0)
+        self._check_file(file_extension, f.size, head)
+
+    @staticmethod
+    async def _content_key(f: UploadFile, file_extension):
+        """The s3 key of an uploaded file, derived from its content.
+
+        The same content always gets the same key, so it is stored once.
+        """
+        # hashlib releases the gil, hash big files off the event loop
+        digest = await asyncio.to_thread(content_hash, f.file)
+        await f.seek(0)
+        return f"{digest}.{file_extension}"
+
+    @staticmethod
+    def _media_json(mediafiles):
+        """Media as they are serialized in the thread and post json."""
+        return [
+            {
+                "file_id": mediafile["s3_filename"],
+                "filename": mediafile["filename"],
+                "thumbnail": mediafile["thumbnail"],
+            }
+            for mediafile in mediafiles
+        ]
+
+    async def _get_uploaded_files(self, file_ids):
+        """Look up files the client has uploaded through presigned urls."""
+        return await asyncio.gather(*map(self._get_uploaded_file, file_ids))
+
+    async def _get_uploaded_file(self, file_id):
+        # the first bytes to sniff, the size comes with the range
+        try:
+            s3_file = await self.s3_client.get_object(
+                Bucket="bucket",
+                Key=PENDING_PREFIX + file_id,
+                Range=f"bytes=0-{SNIFF_BYTES - 1}",
+            )
+        except ClientError as ex:
+            if ex.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                raise FileNotExists
+            elif ex.response["Error"]["Code"] == "InvalidRange":
+                raise FileTypeNotSupported("File is empty")
+            else:
+                raise
+        # only presigned uploads carry the original filename
+        if "filename" not in s3_file["Metadata"]:
+            raise FileNotExists
+        self._check_file(
+            pathlib.Path(file_id).suffix[1:],
+            int(s3_file["ContentRange"].rpartition("/")[2]),
+            await s3_file["Body"].read(),
+        )
+        return {
+            "s3_filename": file_id,
+            "filename": urllib.parse.unquote(s3_file["Metadata"]["filename"]),
+            "thumbnail": None,
+        }
+
+    async def _upload_files(self, uploads):
+        """Upload ``(fileobj, s3_filename)`` pairs concurrently to the pending prefix.
+
+        At most ``s3_upload_concurrency`` files of one request and
+        ``s3_max_concurrent_uploads`` files of the whole worker are in flight.
+        """
+        request_semaphore = asyncio.Semaphore(config.s3_upload_concurrency)
+
+        async def upload(fileobj, s3_filename):
+            async with request_semaphore, self.resources["s3_upload_semaphore"]:
+                with time_s3_operation("upload_fileobj"):
+                    await self.s3_client.upload_fileobj(
+                        fileobj,
+                        "bucket",
+                        PENDING_PREFIX + s3_filename,
+                        Config=self.resources["s3_transfer_config"],
+                    )
+
+        await asyncio.gather(*(upload(*upload_args) for upload_args in uploads))
+
+    async def _store_files(self, uploads, mediafiles):
+        """Store ``(file, s3_filename)`` uploads and the thumbnails of ``mediafiles``.
+
+        Files whose content is already stored are neither uploaded nor
+        thumbnailed again, unless the reaper deleted their objects after the
+        blob was last dereferenced. Sets ``mediafile["thumbnail"]`` of every
+        image, ``None`` for presigned uploads among ``mediafiles`` which are
+        thumbnailed by a job, and promotes the files, including those.
+        """
+        blobs = await self._get_blobs([s3_filename for _, s3_filename in uploads])
+        missing = await self._get_missing_files(
+            list(blobs) + [thumbnail for thumbnail in blobs.values() if thumbnail]
+        )
+        blobs = {
+            key: thumbnail
+            for key, thumbnail in blobs.items()
+            if key not in missing and thumbnail not in missing
+        }
+        new_uploads = {
+            s3_filename: f for f, s3_filename in uploads if s3_filename not in blobs
+        }
+        await self._upload_files(
+            (f, s3_filename) for s3_filename, f in new_uploads.items()
+        )
+        images = {mediafile["s3_filename"] for mediafile in mediafiles}
+        thumbnails = await self._create_thumbnails(
+            (f, s3_filename)
+            for s3_filename, f in new_uploads.items()
+            if s3_filename in images
+        )
+        blobs.update(thumbnails)
+        for mediafile in mediafiles:
+            mediafile["thumbnail"] = blobs.get(mediafile["s3_filename"])
+
+        uploaded = {s3_filename for _, s3_filename in uploads}
+        await self._promote_files(
+            list(new_uploads)
+            + [thumbnail for thumbnail in thumbnails.values() if thumbnail]
+            + [
+                mediafile["s3_filename"]
+                for mediafile in mediafiles
+                if mediafile["s3_filename"] not in uploaded
+            ]
+        )
+
+    async def _get_blobs(self, keys):
+        """``{key: thumbnail}`` of the blobs among ``keys`` that are stored."""
+        if not keys:
+            return {}
+        async with self.db_engine.connect() as conn:
+            blobs = await conn.execute(
+                sqlalchemy.Select(
+                    media_blobs_table.columns["key"],
+                    media_blobs_table.columns["thumbnail"],
+                ).where(
+                    media_blobs_table.columns["key"].in_(keys),
+                    # unreferenced blobs may be reaped any time
+                    media_blobs_table.columns["ref_count"] > 0,
+                )
+            )
+        return dict(blobs.fetchall())
+
+    async def _get_missing_files(self, keys):
+        """The keys among ``keys`` that have no object."""
+
+        async def is_missing(key):
+            try:
+                await self.s3_client.head_object(Bucket="bucket", Key=key)
+            except ClientError as ex:
+                if ex.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                    return True
+                raise
+            return False
+
+        missing = await asyncio.gather(*map(is_missing, keys))
+        return {key for key, is_missing in zip(keys, missing) if is_missing}
+
+    async def _create_thumbnails(self, uploads):
+        """Make and upload thumbnails for already uploaded ``(file, s3_filename)``.
+
+        Images are decoded in the process pool. Returns ``{s3_filename:
+        thumbnail}``, the thumbnail is ``None`` for files that couldn't be read.
+        """
+        loop = asyncio.get_running_loop()
+
+        async def create_thumbnail(f, s3_filename):
+            await f.seek(0)
+            return await loop.run_in_executor(
+                self.resources["process_pool"],
+                make_thumbnail,
+                await f.read(),
+                config.thumbnail_size,
+            )
+
+        uploads = list(uploads)
+        thumbnails = await asyncio.gather(*(create_thumbnail(*u) for u in uploads))
+        await self._upload_files(
+            (io.BytesIO(thumbnail), thumbnail_name(s3_filename))
+            for (_, s3_filename), thumbnail in zip(uploads, thumbnails)
+            if thumbnail is not None
+        )
+        return {
+            s3_filename: thumbnail_name(s3_filename) if thumbnail is not None else None
+            for (_, s3_filename), thumbnail in zip(uploads, thumbnails)
+        }
+
+    async def _promote_files(self, s3_filenames):
+        """Move files out of the pending prefix.
+
+        Writes promote their files before committing, so the files can be served
+        as soon as the write is visible and announced. Files of a write that
+        fails after that are deleted by the orphan reaper. Failures are only
+        logged, the reaper also promotes pending files the db references.
+        """
+
+        async def promote(s3_filename):
+            async with self.resources["s3_upload_semaphore"]:
+                await self.s3_client.copy_object(
+                    Bucket="bucket",
+                    Key=s3_filename,
+                    CopySource={
+                        "Bucket": "bucket",
+                        "Key": PENDING_PREFIX + s3_filename,
+                    },
+                )
+
+        try:
+            await asyncio.gather(*map(promote, s3_filenames))
+            await self._delete_files(PENDING_PREFIX + f for f in s3_filenames)
+        except ClientError:
+            logger.exception("Failed to promote pending files")
+
+    async def _delete_files(self, keys):
+        keys = list(keys)
+        # delete_objects takes at most 1000 keys
+        for i in range(0, len(keys), 1000):
+            await self.s3_client.delete_objects(
+                Bucket="bucket",
+                Delete={
+                    "Objects": [{"Key": key} for key in keys[i : i + 1000]],
+                    "Quiet": True,
+                },
+            )
+
+    @staticmethod
+    def _notify(**event):
+        """Publish ``event`` to the subscribers of every worker on commit.
+
+        Values may be sql expressions, select it in the write statement.
+        """
+        return sqlalchemy.func.pg_notify(
+            EVENTS_CHANNEL,
+            sqlalchemy.cast(
+                sqlalchemy.func.json_build_object(
+                    *(arg for item in event.items() for arg in item)
+                ),
+                sqlalchemy.Text,
+            ),
+        )
+
+    @staticmethod
+    def _enqueue(kind, **payload):
+        """Insert a job that the job workers run once the write commits.
+
+        Values may be sql expressions, add it as a cte of the write statement,
+        no job is queued if they select no row.
+        """
+        return insert(jobs_table).from_select(
+            ["kind", "payload", "attempts", "run_at"],
+            sqlalchemy.Select(
+                sqlalchemy.literal(kind),
+                sqlalchemy.func.jsonb_build_object(
+                    *(arg for item in payload.items() for arg in item)
+                ),
+                sqlalchemy.literal(0),
+                sqlalchemy.func.now(),
+            ),
+        )
+
+    def _enqueue_thumbnails(self, written, mediafiles):
+        """Queue a thumbnail job for every image of ``mediafiles`` without one.
+
+        Presigned uploads are only thumbnailed by the job. Only queues jobs if
+        the ``written`` cte has a row.
+        """
+        media = self._select_mediafiles(
+            [mediafile for mediafile in mediafiles if mediafile["thumbnail"] is None]
+        )
+        unthumbnailed = (
+            sqlalchemy.Select(media.columns["s3_filename"])
+            .select_from(written.join(media, sqlalchemy.true()))
+            .cte("unthumbnailed_media")
+        )
+        return self._enqueue("thumbnail", key=unthumbnailed.columns["s3_filename"])
+
+    @staticmethod
+    def _select_mediafiles(mediafiles):
+        """Rows of ``mediafiles`` to insert into one of the media tables."""
+        return (
+            sqlalchemy.func.jsonb_to_recordset(
+                sqlalchemy.cast(
+                    [
+                        {
+                            "filename": mediafile["filename"],
+                            "s3_filename": mediafile["s3_filename"],
+                            "thumbnail": mediafile["thumbnail"],
+                        }
+                        for mediafile in mediafiles
+                    ],
+                    JSONB,
+                )
+            )
+            .table_valued(
+                sqlalchemy.column("filename", sqlalchemy.String),
+                sqlalchemy.column("s3_filename", sqlalchemy.String),
+                sqlalchemy.column("thumbnail", sqlalchemy.String),
+            )
+            .render_derived(with_types=True)
+        )
+
+    @staticmethod
+    def _reference_blobs(written, mediafiles, voice=None):
+        """Count the references of a write to its blobs, adding the new ones.
+
+        Only writes if the ``written`` cte has a row.
+        """
+        refs = collections.Counter(mediafile["s3_filename"] for mediafile in mediafiles)
+        thumbnails = {
+            mediafile["s3_filename"]: mediafile["thumbnail"] for mediafile in mediafiles
+        }
+        if voice is not None:
+            refs[voice] += 1
+        blobs = (
+            sqlalchemy.func.jsonb_to_recordset(
+                sqlalchemy.cast(
+                    [
+                        {
+                            "key": key,
+                            "thumbnail": thumbnails.get(key),
+                            "ref_count": count,
+                        }
+                        # concurrent writes lock shared blobs in the same
+                        # order, they can't deadlock
+                        for key, count in sorted(refs.items())
+                    ],
+                    JSONB,
+                )
+            )
+            .table_valued(
+                sqlalchemy.column("key", sqlalchemy.String),
+                sqlalchemy.column("thumbnail", sqlalchemy.String),
+                sqlalchemy.column("ref_count", sqlalchemy.Integer),
+            )
+            .render_derived(with_types=True)
+        )
+        reference_blobs = insert(media_blobs_table).from_select(
+            ["key", "thumbnail", "ref_count"],
+            sqlalchemy.Select(
+                blobs.columns["key"],
+                blobs.columns["thumbnail"],
+                blobs.columns["ref_count"],
+            ).select_from(written.join(blobs, sqlalchemy.true())),
+        )
+        return reference_blobs.on_conflict_do_update(
+            index_elements=["key"],
+            set_={
+                "ref_count": media_blobs_table.columns["ref_count"]
+                + reference_blobs.excluded["ref_count"]
+            },
+        )
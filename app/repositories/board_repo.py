@@ -1,12 +1,48 @@
+import asyncio
+import logging
+
 import sqlalchemy
+from sqlalchemy.dialects.postgresql import insert
 
 from app.db_schema import boards_table
+from app.metrics import instrumented
 from app.repositories.abstract_repo import Repo
 
+logger = logging.getLogger(__name__)
+
 
 class BoardRepo(Repo):
     async def get_boards(self):
+        return list(self.boards.values())
+
+    def check_board(self, board):
+        self._check_board(board)
+
+    @instrumented
+    async def create_board(self, slug, name):
         async with self.db_engine.begin() as conn:
-            get_boards_stmt = sqlalchemy.Select(boards_table)
+            create_board_stmt = (
+                insert(boards_table)
+                .values(slug=slug, name=name)
+                .on_conflict_do_nothing(index_elements=["slug"])
+            )
+            await conn.execute(create_board_stmt)
+        await self.load_boards()
+
+    @instrumented
+    async def load_boards(self):
+        async with self.db_engine.begin() as conn:
+            get_boards_stmt = sqlalchemy.Select(boards_table).order_by(
+                boards_table.columns["slug"]
+            )
             boards = (await conn.execute(get_boards_stmt)).mappings().fetchall()
-        return boards
+        self.resources["boards"] = {board["slug"]: dict(board) for board in boards}
+
+    async def refresh_boards(self, interval):
+        # boards may be added by other workers or by hand, pick them up eventually
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.load_boards()
+            except Exception:
+                logger.exception("Failed to refresh boards")
@@ -1,16 +1,351 @@
+import asyncio
+import datetime
+import io
+import logging
+import pathlib
+import typing
+import urllib.parse
+import uuid
+
+import sqlalchemy
 from botocore.exceptions import ClientError
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import JSONB, aggregate_order_by
+
+from app.config import config
+from app.db_schema import (
+    media_blobs_table,
+    post_media_files_table,
+    posts_table,
+    thread_media_files_table,
+    thread_summaries_table,
+    threads_table,
+)
+from app.exceptions import FileNotExists, FileTypeNotSupported, RangeNotSatisfiable
+from app.metrics import instrumented
+from app.repositories.abstract_repo import PENDING_PREFIX, Repo
+from app.thumbnails import make_thumbnail, thumbnail_name
 
-from app.exceptions import FileNotExists
-from app.repositories.abstract_repo import Repo
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# pg advisory lock id, only one worker reaps at a time
+REAP_ORPHANS_LOCK = 0x72656170
 
 
 class FileRepo(Repo):
-    async def download_file(self, file_id: str):
+    def get_cached_file(self, file_id: str):
+        if self.media_cache is None:
+            return None
+        return self.media_cache.get(file_id)
+
+    @instrumented
+    async def download_file(self, file_id: str, range: typing.Optional[str] = None):
+        range_args = {"Range": range} if range else {}
         try:
-            s3_file = await self.s3_client.get_object(Bucket="bucket", Key=file_id)
+            s3_file = await self.s3_client.get_object(
+                Bucket="bucket", Key=file_id, **range_args
+            )
         except ClientError as ex:
             if ex.response["Error"]["Code"] == "NoSuchKey":
                 raise FileNotExists
+            elif ex.response["Error"]["Code"] == "InvalidRange":
+                raise RangeNotSatisfiable(ex.response["Error"].get("ActualObjectSize"))
+            else:
+                raise
+        body = s3_file["Body"].iter_chunks(CHUNK_SIZE)
+        if self.media_cache is not None and not range_args:
+            body = self.media_cache.fill(file_id, body)
+        return {
+            "body": body,
+            "content_length": s3_file["ContentLength"],
+            "content_range": s3_file.get("ContentRange"),
+        }
+
+    @instrumented
+    async def get_file_info(self, file_id: str):
+        try:
+            s3_file = await self.s3_client.head_object(Bucket="bucket", Key=file_id)
+        except ClientError as ex:
+            if ex.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                raise FileNotExists
             else:
                 raise
-        return s3_file["Body"].iter_chunks()
+        return {"content_length": s3_file["ContentLength"]}
+
+    async def create_upload_urls(self, filenames: typing.List[str]):
+        uploads = []
+        for filename in filenames:
+            file_extension = pathlib.Path(filename).suffix[1:]
+            if file_extension not in config.allowed_extenions:
+                raise FileTypeNotSupported(
+                    f"Типы поддерживаемых файлов: {', '.join(config.allowed_extenions)}"
+                )
+            file_id = f"{str(uuid.uuid4())}.{file_extension}"
+            # s3 metadata is ascii only
+            metadata = {"filename": urllib.parse.quote(filename)}
+            url = await self.s3_presign_client.generate_presigned_url(
+                "put_object",
+                Params={
+                    "Bucket": "bucket",
+                    "Key": PENDING_PREFIX + file_id,
+                    "Metadata": metadata,
+                },
+                ExpiresIn=config.s3_presigned_url_expires,
+            )
+            uploads.append(
+                {
+                    "file_id": file_id,
+                    "filename": filename,
+                    "url": url,
+                    "headers": {"x-amz-meta-filename": metadata["filename"]},
+                }
+            )
+        return uploads
+
+    async def get_download_url(self, file_id: str):
+        return await self.s3_presign_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": "bucket", "Key": file_id},
+            ExpiresIn=config.s3_presigned_url_expires,
+        )
+
+    @instrumented
+    async def create_thumbnail(self, key):
+        """Make the thumbnail of an image that has none, run as a job.
+
+        Images uploaded through presigned urls are thumbnailed here, after the
+        write. Images that can't be read are left without one.
+        """
+        try:
+            s3_file = await self.s3_client.get_object(Bucket="bucket", Key=key)
+        except ClientError as ex:
+            # reaped since, nothing references it anymore
+            if ex.response["Error"]["Code"] == "NoSuchKey":
+                return
+            raise
+        thumbnail = await asyncio.get_running_loop().run_in_executor(
+            self.resources["process_pool"],
+            make_thumbnail,
+            await s3_file["Body"].read(),
+            config.thumbnail_size,
+        )
+        if thumbnail is None:
+            return
+        await self._upload_files([(io.BytesIO(thumbnail), thumbnail_name(key))])
+        await self._promote_files([thumbnail_name(key)])
+        async with self.db_engine.begin() as conn:
+            await conn.execute(self._set_thumbnail_stmt(key, thumbnail_name(key)))
+
+    def _set_thumbnail_stmt(self, key, thumbnail):
+        """Set the thumbnail of a blob, of its attachments and of their json.
+
+        Notifies a thread_update or a post_update for every attachment.
+        """
+        update_blob = (
+            sqlalchemy.Update(media_blobs_table)
+            .where(media_blobs_table.columns["key"] == key)
+            .values(thumbnail=thumbnail)
+        )
+        thread_media = (
+            sqlalchemy.Update(thread_media_files_table)
+            .where(thread_media_files_table.columns["s3_filename"] == key)
+            .values(thumbnail=thumbnail)
+            .returning(thread_media_files_table.columns["thread"])
+            .cte("thread_media")
+        )
+        post_media = (
+            sqlalchemy.Update(post_media_files_table)
+            .where(post_media_files_table.columns["s3_filename"] == key)
+            .values(thumbnail=thumbnail)
+            .returning(post_media_files_table.columns["post"])
+            .cte("post_media")
+        )
+        attachments = sqlalchemy.union_all(
+            sqlalchemy.Select(
+                thread_media.columns["thread"],
+                sqlalchemy.cast(sqlalchemy.null(), sqlalchemy.BigInteger).label("post"),
+            ),
+            sqlalchemy.Select(
+                posts_table.columns["thread"], post_media.columns["post"]
+            ).where(posts_table.columns["id"] == post_media.columns["post"]),
+        ).cte("attachments")
+        thread = (
+            sqlalchemy.Select(
+                attachments.columns["thread"],
+                attachments.columns["post"],
+                threads_table.columns["board"],
+            )
+            .where(threads_table.columns["id"] == attachments.columns["thread"])
+            .cte("attachment_thread")
+        )
+
+        preview = (
+            func.jsonb_array_elements(thread_summaries_table.columns["preview_posts"])
+            .table_valued(sqlalchemy.column("post", JSONB), with_ordinality="position")
+            .render_derived("preview")
+        )
+        preview_post = preview.columns["post"]
+        update_summary = (
+            sqlalchemy.Update(thread_summaries_table)
+            .where(
+                thread_summaries_table.columns["thread"] == thread.columns["thread"],
+                thread_summaries_table.columns["board"] == thread.columns["board"],
+            )
+            .values(
+                media=self._set_thumbnail_json(
+                    thread_summaries_table.columns["media"], key, thumbnail
+                ),
+                preview_posts=func.coalesce(
+                    sqlalchemy.Select(
+                        func.jsonb_agg(
+                            aggregate_order_by(
+                                preview_post.concat(
+                                    func.jsonb_build_object(
+                                        "media",
+                                        self._set_thumbnail_json(
+                                            preview_post["media"], key, thumbnail
+                                        ),
+                                    )
+                                ),
+                                preview.columns["position"],
+                            )
+                        )
+                    ).scalar_subquery(),
+                    thread_summaries_table.columns["preview_posts"],
+                ),
+            )
+        )
+
+        return sqlalchemy.Select(
+            self._notify(
+                type=sqlalchemy.case(
+                    (thread.columns["post"].is_(None), "thread_update"),
+                    else_="post_update",
+                ),
+                board=thread.columns["board"],
+                thread=thread.columns["thread"],
+                post=thread.columns["post"],
+            )
+        ).add_cte(
+            update_blob.cte("update_blob"),
+            update_summary.cte("update_summary"),
+        )
+
+    @staticmethod
+    def _set_thumbnail_json(media, key, thumbnail):
+        """``media`` json with the thumbnail of every file ``key`` set."""
+        element = (
+            func.jsonb_array_elements(media)
+            .table_valued(
+                sqlalchemy.column("mediafile", JSONB), with_ordinality="position"
+            )
+            .render_derived("element")
+        )
+        mediafile = element.columns["mediafile"]
+        return func.coalesce(
+            sqlalchemy.Select(
+                func.jsonb_agg(
+                    aggregate_order_by(
+                        sqlalchemy.case(
+                            (
+                                mediafile["file_id"].astext == key,
+                                mediafile.concat(
+                                    func.jsonb_build_object("thumbnail", thumbnail)
+                                ),
+                            ),
+                            else_=mediafile,
+                        ),
+                        element.columns["position"],
+                    )
+                )
+            ).scalar_subquery(),
+            # jsonb_agg of no elements is null
+            media,
+        )
+
+    @instrumented
+    async def reap_orphans(self):
+        """Delete objects of no referenced blob and promote pending ones of one.
+
+        Objects younger than ``s3_reaper_grace_period`` are skipped, they may
+        belong to a request that hasn't committed yet.
+        """
+        cutoff = datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(
+            seconds=config.s3_reaper_grace_period
+        )
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        async for page in paginator.paginate(Bucket="bucket"):
+            keys = [
+                s3_object["Key"]
+                for s3_object in page.get("Contents", [])
+                if s3_object["LastModified"] < cutoff
+            ]
+            referenced = await self._get_referenced_files(
+                key.removeprefix(PENDING_PREFIX) for key in keys
+            )
+            await self._promote_files(
+                [
+                    key.removeprefix(PENDING_PREFIX)
+                    for key in keys
+                    if key.startswith(PENDING_PREFIX)
+                    and key.removeprefix(PENDING_PREFIX) in referenced
+                ]
+            )
+            orphans = [
+                key
+                for key in keys
+                if key.removeprefix(PENDING_PREFIX) not in referenced
+            ]
+            # a write may have referenced them meanwhile, check again right
+            # before deleting
+            referenced = await self._get_referenced_files(
+                key.removeprefix(PENDING_PREFIX) for key in orphans
+            )
+            await self._delete_files(
+                key
+                for key in orphans
+                if key.removeprefix(PENDING_PREFIX) not in referenced
+            )
+
+    @instrumented
+    async def reap_orphans_periodically(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with self.db_engine.connect() as conn:
+                    lock_stmt = sqlalchemy.Select(
+                        sqlalchemy.func.pg_try_advisory_lock(REAP_ORPHANS_LOCK)
+                    )
+                    if not (await conn.execute(lock_stmt)).scalar():
+                        continue
+                    try:
+                        await self.reap_orphans()
+                    finally:
+                        unlock_stmt = sqlalchemy.Select(
+                            sqlalchemy.func.pg_advisory_unlock(REAP_ORPHANS_LOCK)
+                        )
+                        await conn.execute(unlock_stmt)
+            except Exception:
+                logger.exception("Failed to reap orphaned files")
+
+    async def _get_referenced_files(self, s3_filenames):
+        async with self.db_engine.connect() as conn:
+            referenced = await conn.execute(
+                self._get_referenced_files_stmt(list(s3_filenames))
+            )
+        return set(referenced.scalars())
+
+    def _get_referenced_files_stmt(self, s3_filenames):
+        return sqlalchemy.union(
+            *(
+                sqlalchemy.Select(column).where(
+                    column.in_(s3_filenames),
+                    media_blobs_table.columns["ref_count"] > 0,
+                )
+                for column in (
+                    media_blobs_table.columns["key"],
+                    media_blobs_table.columns["thumbnail"],
+                )
+            )
+        )
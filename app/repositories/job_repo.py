@@ -0,0 +1,156 @@
+import asyncio
+import datetime
+import logging
+import typing
+
+import sqlalchemy
+from sqlalchemy import func
+
+from app.config import config
+from app.db_schema import jobs_table
+from app.metrics import instrumented
+from app.repositories.abstract_repo import Repo
+
+logger = logging.getLogger(__name__)
+
+# coroutine functions by the kind of job they run, called with its payload as
+# keyword arguments
+Handlers = typing.Mapping[str, typing.Callable[..., typing.Awaitable]]
+
+
+class JobRepo(Repo):
+    @instrumented
+    async def run_jobs(self, handlers: Handlers, batch_size):
+        """Take up to ``batch_size`` due jobs and run them concurrently.
+
+        Jobs queued by the writes (see ``Repo._enqueue``) are leased for
+        ``job_lease`` seconds, so handlers must be safe to run twice: a job is
+        run again if its worker dies before it is done. Returns how many jobs
+        were taken.
+        """
+        async with self.db_engine.connect() as conn:
+            await conn.execution_options(isolation_level="AUTOCOMMIT")
+            taken = (await conn.execute(self._take_jobs_stmt(batch_size))).fetchall()
+        jobs = []
+        for job in taken:
+            if job.failed_at is None:
+                jobs.append(job)
+            else:
+                logger.error(
+                    "Job %d (%s) failed, its worker stopped during the last attempt",
+                    job.id,
+                    job.kind,
+                )
+        if not jobs:
+            return len(taken)
+
+        results = await asyncio.gather(
+            *(self._run_job(handlers, job) for job in jobs), return_exceptions=True
+        )
+        done = []
+        failed = []
+        for job, result in zip(jobs, results):
+            if isinstance(result, asyncio.CancelledError):
+                # cut short, not failed, it runs again once its lease is over
+                logger.warning("Job %d (%s) was cancelled", job.id, job.kind)
+            elif isinstance(result, BaseException):
+                logger.error(
+                    "Job %d (%s) failed, attempt %d",
+                    job.id,
+                    job.kind,
+                    job.attempts,
+                    exc_info=result,
+                )
+                failed.append(self._retry_job_stmt(job, repr(result)))
+            else:
+                done.append(job.id)
+        async with self.db_engine.begin() as conn:
+            if done:
+                await conn.execute(
+                    sqlalchemy.Delete(jobs_table).where(
+                        jobs_table.columns["id"].in_(done)
+                    )
+                )
+            for retry_job_stmt in failed:
+                await conn.execute(retry_job_stmt)
+        return len(taken)
+
+    @instrumented
+    async def run_jobs_periodically(self, handlers: Handlers, interval, batch_size):
+        while True:
+            try:
+                taken = await self.run_jobs(handlers, batch_size)
+            except Exception:
+                logger.exception("Failed to run jobs")
+                taken = 0
+            # after a full batch more are likely due
+            if taken < batch_size:
+                await asyncio.sleep(interval)
+
+    @staticmethod
+    async def _run_job(handlers: Handlers, job):
+        await handlers[job.kind](**job.payload)
+
+    def _take_jobs_stmt(self, batch_size):
+        """Lease the oldest due jobs, skipping the ones other workers are taking.
+
+        A job that is due again after ``job_max_attempts`` had its lease run out
+        on the last attempt, its worker died or hung on it. It is marked failed
+        instead of leased. Selects the id, kind, payload, attempts and
+        failed_at of every job taken.
+        """
+        out_of_attempts = jobs_table.columns["attempts"] >= config.job_max_attempts
+        due_jobs = (
+            sqlalchemy.Select(jobs_table.columns["id"])
+            .where(
+                jobs_table.columns["failed_at"].is_(None),
+                jobs_table.columns["run_at"] <= func.now(),
+            )
+            .order_by(jobs_table.columns["run_at"])
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        return (
+            sqlalchemy.Update(jobs_table)
+            .where(jobs_table.columns["id"].in_(due_jobs.scalar_subquery()))
+            .values(
+                attempts=sqlalchemy.case(
+                    (out_of_attempts, jobs_table.columns["attempts"]),
+                    else_=jobs_table.columns["attempts"] + 1,
+                ),
+                run_at=func.now() + datetime.timedelta(seconds=config.job_lease),
+                failed_at=sqlalchemy.case((out_of_attempts, func.now())),
+                error=sqlalchemy.case(
+                    (out_of_attempts, "Lease expired"),
+                    else_=jobs_table.columns["error"],
+                ),
+            )
+            .returning(
+                jobs_table.columns["id"],
+                jobs_table.columns["kind"],
+                jobs_table.columns["payload"],
+                jobs_table.columns["attempts"],
+                jobs_table.columns["failed_at"],
+            )
+        )
+
+    @staticmethod
+    def _retry_job_stmt(job, error):
+        """Run a failed job again later, the delay doubles with every attempt.
+
+        The job is marked failed after ``job_max_attempts``.
+        """
+        values = {"error": error}
+        if job.attempts >= config.job_max_attempts:
+            values["failed_at"] = func.now()
+        else:
+            delay = min(
+                config.job_retry_delay * 2 ** (job.attempts - 1),
+                config.job_retry_max_delay,
+            )
+            values["run_at"] = func.now() + datetime.timedelta(seconds=delay)
+        return (
+            sqlalchemy.Update(jobs_table)
+            .where(jobs_table.columns["id"] == job.id)
+            .values(**values)
+        )
@@ -1,71 +1,298 @@
-import datetime
+import asyncio
 import pathlib
 import typing
-import uuid
 
 import sqlalchemy
 from fastapi import UploadFile
-from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import JSONB, aggregate_order_by, insert
 
 from app.config import config
-from app.db_schema import post_media_files_table, posts_table, threads_table
-from app.exceptions import FileTypeNotSupported, ThreadNotExists
-from app.repositories.abstract_repo import Repo
+from app.db_schema import (
+    post_media_files_table,
+    posts_table,
+    thread_summaries_table,
+    threads_table,
+)
+from app.exceptions import (
+    FileTypeNotSupported,
+    ThreadArchived,
+    ThreadNotExists,
+)
+from app.metrics import instrumented
+from app.repositories.abstract_repo import PREVIEW_POSTS, Repo
+from app.voice import parse_voice
 
 
 class PostRepo(Repo):
+    @instrumented
     async def create_post(
-        self, thread_id, files: typing.List[UploadFile], voice_message: UploadFile
+        self,
+        thread_id,
+        files: typing.List[UploadFile],
+        voice_message: typing.Optional[UploadFile],
+        file_ids: typing.Sequence[str] = (),
+        voice_id: typing.Optional[str] = None,
     ):
-        voice = str(uuid.uuid4()) + ".mp3"
-        if pathlib.Path(voice_message.filename).suffix != ".mp3":
+        voice_filename = voice_message.filename if voice_message else voice_id
+        if pathlib.Path(voice_filename).suffix != ".mp3":
             raise FileTypeNotSupported("Only mp3 voice messages supported")
-        await self.s3_client.upload_fileobj(voice_message, "bucket", voice)
-
-        mediafiles = []
-        for f in files:
-            file_extension = pathlib.Path(f.filename).suffix[1:]
-            if file_extension not in config.allowed_meida_extenions:
-                raise FileTypeNotSupported(
-                    f"Типы поддерживаемых медиафайлов: {', '.join(config.allowed_meida_extenions)}"
-                )
-            mediafiles.append(
-                {
-                    "s3_filename": f"{str(uuid.uuid4())}.{file_extension}",
-                    "filename": f.filename,
-                }
+        for file_id in file_ids:
+            self._check_media_extension(file_id)
+        async with self.db_engine.connect() as conn:
+            await self._check_thread(conn, thread_id)
+        mediafiles = list(await asyncio.gather(*map(self._new_media_file, files)))
+
+        uploads = [
+            (f, mediafile["s3_filename"]) for f, mediafile in zip(files, mediafiles)
+        ]
+        uploaded_voice = []
+        if voice_message is not None:
+            await self._check_upload(voice_message, "mp3")
+            voice = await self._content_key(voice_message, "mp3")
+            uploads.append((voice_message, voice))
+        else:
+            voice = (await self._get_uploaded_file(voice_id))["s3_filename"]
+            uploaded_voice.append(voice)
+        mediafiles += await self._get_uploaded_files(file_ids)
+        await asyncio.gather(
+            self._store_files(uploads, mediafiles),
+            self._promote_files(uploaded_voice),
+        )
+
+        # a single statement is atomic by itself, skip BEGIN and COMMIT
+        async with self.db_engine.connect() as conn:
+            await conn.execution_options(isolation_level="AUTOCOMMIT")
+            post = (
+                await conn.execute(self._create_post_stmt(thread_id, voice, mediafiles))
+            ).fetchone()
+            # the thread was archived since it was checked
+            if post is None:
+                await self._check_thread(conn, thread_id)
+                raise ThreadArchived
+        self.page_cache.invalidate(post.board)
+
+    @staticmethod
+    async def _check_thread(conn, thread_id):
+        """Raise unless the thread exists and takes posts.
+
+        Checked before anything is uploaded, the write statement checks again.
+        """
+        get_thread_stmt = sqlalchemy.Select(threads_table.columns["archived_at"]).where(
+            threads_table.columns["id"] == thread_id
+        )
+        thread = (await conn.execute(get_thread_stmt)).fetchone()
+        if thread is None:
+            raise ThreadNotExists
+        if thread.archived_at is not None:
+            raise ThreadArchived
+
+    @instrumented
+    async def update_voice_metadata(self, post, voice):
+        """Read the metadata of the voice message of a post, run as a job."""
+        s3_file = await self.s3_client.get_object(Bucket="bucket", Key=voice)
+        voice_metadata = await self._parse_voice(await s3_file["Body"].read())
+        async with self.db_engine.begin() as conn:
+            await conn.execute(self._update_voice_metadata_stmt(post, voice_metadata))
+
+    async def _parse_voice(self, data):
+        """Voice message metadata, parsed in the process pool.
+
+        All values are ``None`` if the message has no mp3 frames.
+        """
+        voice_metadata = await asyncio.get_running_loop().run_in_executor(
+            self.resources["process_pool"],
+            parse_voice,
+            data,
+            config.voice_waveform_peaks,
+        )
+        return voice_metadata or {"duration": None, "bitrate": None, "waveform": None}
+
+    def _update_voice_metadata_stmt(self, post_id, voice_metadata):
+        """Set the voice metadata of a post, in its preview too if it has one."""
+        updated_post = (
+            sqlalchemy.Update(posts_table)
+            .where(posts_table.columns["id"] == post_id)
+            .values(
+                voice_duration=voice_metadata["duration"],
+                voice_bitrate=voice_metadata["bitrate"],
+                voice_waveform=voice_metadata["waveform"],
             )
-            await self.s3_client.upload_fileobj(
-                f, "bucket", mediafiles[-1]["s3_filename"]
+            .returning(
+                posts_table.columns["thread"],
+                posts_table.columns["voice_duration"],
+                posts_table.columns["voice_bitrate"],
+                posts_table.columns["voice_waveform"],
             )
+            .cte("updated_post")
+        )
+        thread = (
+            sqlalchemy.Select(
+                threads_table.columns["id"], threads_table.columns["board"]
+            )
+            .where(threads_table.columns["id"] == updated_post.columns["thread"])
+            .cte("post_thread")
+        )
 
-        async with self.db_engine.begin() as conn:
-            # TODO replace to try block?
-            get_thread_stmt = sqlalchemy.Select(threads_table).where(
-                threads_table.columns["id"] == thread_id
+        preview_posts = thread_summaries_table.columns["preview_posts"]
+        preview = (
+            func.jsonb_array_elements(preview_posts)
+            .table_valued(sqlalchemy.column("post", JSONB), with_ordinality="position")
+            .render_derived("preview")
+        )
+        preview_post = preview.columns["post"]
+        metadata = func.jsonb_build_object(
+            "voice_duration",
+            updated_post.columns["voice_duration"],
+            "voice_bitrate",
+            updated_post.columns["voice_bitrate"],
+            "voice_waveform",
+            updated_post.columns["voice_waveform"],
+        )
+        update_summary = (
+            sqlalchemy.Update(thread_summaries_table)
+            .where(
+                thread_summaries_table.columns["thread"] == thread.columns["id"],
+                thread_summaries_table.columns["board"] == thread.columns["board"],
+                preview_posts.contains(
+                    func.jsonb_build_array(func.jsonb_build_object("id", post_id))
+                ),
             )
-            if (await conn.execute(get_thread_stmt)).rowcount == 0:
-                raise ThreadNotExists
+            .values(
+                preview_posts=sqlalchemy.Select(
+                    func.jsonb_agg(
+                        aggregate_order_by(
+                            sqlalchemy.case(
+                                (
+                                    preview_post["id"]
+                                    == func.to_jsonb(sqlalchemy.literal(post_id)),
+                                    preview_post.concat(metadata),
+                                ),
+                                else_=preview_post,
+                            ),
+                            preview.columns["position"],
+                        )
+                    )
+                )
+                .select_from(preview.join(updated_post, sqlalchemy.true()))
+                .scalar_subquery()
+            )
+        )
 
-            create_post_stmt = (
-                insert(posts_table)
-                .values(thread=thread_id, voice_message=voice)
-                .returning(posts_table.columns["id"])
+        return sqlalchemy.Select(
+            self._notify(
+                type="post_update",
+                board=thread.columns["board"],
+                thread=thread.columns["id"],
+                post=post_id,
             )
-            create_post_stmt = await conn.execute(create_post_stmt)
-            post_id = create_post_stmt.fetchone()[0]
+        ).add_cte(update_summary.cte("update_summary"))
+
+    def _create_post_stmt(self, thread_id, voice, mediafiles):
+        """Create a post and bump its thread in one statement.
 
-            create_post_media_stmt = insert(post_media_files_table)
-            for mediafile in mediafiles:
-                mediafile["post"] = post_id
-            await conn.execute(create_post_media_stmt, mediafiles)
+        The thread row is locked and bumped first, every other part of the
+        statement only writes if it exists and isn't archived. The voice
+        metadata and thumbnails missing from ``mediafiles`` are left to jobs.
+        Selects the post id and the board.
+        """
+        bumped_thread = (
+            sqlalchemy.Update(threads_table)
+            .where(
+                threads_table.columns["id"] == thread_id,
+                threads_table.columns["archived_at"].is_(None),
+            )
+            .values(last_update=func.now())
+            .returning(threads_table.columns["id"], threads_table.columns["board"])
+            .cte("bumped_thread")
+        )
+        new_post = (
+            insert(posts_table)
+            .from_select(
+                ["thread", "voice_message"],
+                sqlalchemy.Select(
+                    bumped_thread.columns["id"], sqlalchemy.literal(voice)
+                ),
+            )
+            .returning(
+                posts_table.columns["id"],
+                posts_table.columns["thread"],
+                posts_table.columns["voice_duration"],
+                posts_table.columns["voice_bitrate"],
+                posts_table.columns["voice_waveform"],
+            )
+            .cte("new_post")
+        )
+        media = self._select_mediafiles(mediafiles)
+        new_media = insert(post_media_files_table).from_select(
+            ["post", "filename", "s3_filename", "thumbnail"],
+            sqlalchemy.Select(
+                new_post.columns["id"],
+                media.columns["filename"],
+                media.columns["s3_filename"],
+                media.columns["thumbnail"],
+            ).select_from(new_post.join(media, sqlalchemy.true())),
+        )
 
-            update_thread_stmt = sqlalchemy.Update(threads_table).where(
-                threads_table.columns["id"] == thread_id
+        post_count = thread_summaries_table.columns["post_count"]
+        preview_posts = thread_summaries_table.columns["preview_posts"]
+        post = func.jsonb_build_object(
+            "id",
+            new_post.columns["id"],
+            "voice_message",
+            voice,
+            "voice_duration",
+            new_post.columns["voice_duration"],
+            "voice_bitrate",
+            new_post.columns["voice_bitrate"],
+            "voice_waveform",
+            new_post.columns["voice_waveform"],
+            "media",
+            sqlalchemy.cast(self._media_json(mediafiles), JSONB),
+        )
+        update_summary = (
+            sqlalchemy.Update(thread_summaries_table)
+            .where(
+                thread_summaries_table.columns["thread"] == new_post.columns["thread"],
+                thread_summaries_table.columns["board"]
+                == bumped_thread.columns["board"],
             )
-            await conn.execute(
-                update_thread_stmt,
-                {"last_update": datetime.datetime.now(tz=datetime.timezone.utc)},
+            .values(
+                post_count=post_count + 1,
+                media_count=thread_summaries_table.columns["media_count"]
+                + len(mediafiles),
+                preview_posts=sqlalchemy.case(
+                    (
+                        post_count < PREVIEW_POSTS,
+                        preview_posts.concat(func.jsonb_build_array(post)),
+                    ),
+                    else_=preview_posts,
+                ),
+                bump_time=func.now(),
             )
+        )
 
-            await conn.commit()
+        return (
+            sqlalchemy.Select(
+                new_post.columns["id"],
+                bumped_thread.columns["board"],
+                self._notify(
+                    type="post",
+                    board=bumped_thread.columns["board"],
+                    thread=new_post.columns["thread"],
+                    post=new_post.columns["id"],
+                ),
+            )
+            .where(new_post.columns["thread"] == bumped_thread.columns["id"])
+            .add_cte(
+                self._reference_blobs(bumped_thread, mediafiles, voice).cte(
+                    "reference_blobs"
+                ),
+                new_media.cte("new_media"),
+                update_summary.cte("update_summary"),
+                self._enqueue(
+                    "voice_metadata", post=new_post.columns["id"], voice=voice
+                ).cte("voice_metadata_job"),
+                self._enqueue_thumbnails(new_post, mediafiles).cte("thumbnail_jobs"),
+            )
+        )
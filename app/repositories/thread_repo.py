@@ -1,12 +1,12 @@
+import asyncio
 import datetime
-import pathlib
+import logging
 import typing
-import uuid
 
 import sqlalchemy
 from fastapi import UploadFile
 from sqlalchemy import func
-from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.dialects.postgresql import JSONB, aggregate_order_by, insert
 
 from app.config import config
 from app.db_schema import (
@@ -14,125 +14,615 @@ from app.db_schema import (
     post_media_files_table,
     posts_table,
     thread_media_files_table,
+    thread_summaries_table,
     threads_table,
 )
-from app.exceptions import BoardNotExists, FileTypeNotSupported, ThreadNotExists
-from app.repositories.abstract_repo import Repo
+from app.exceptions import (
+    BoardNotExists,
+    InvalidCursor,
+    ThreadNotExists,
+)
+from app.metrics import instrumented
+from app.pagination import decode_cursor, encode_cursor
+from app.repositories.abstract_repo import PREVIEW_POSTS, Repo
+
+logger = logging.getLogger(__name__)
+
+# pg advisory lock id, only one worker archives at a time
+ARCHIVE_THREADS_LOCK = 0x61726368
+THREAD_BOARDS_CACHE_SIZE = 100_000
+# text search configuration of thread.search_vector
+SEARCH_CONFIG = sqlalchemy.literal_column("'russian'")
 
 
 class ThreadRepo(Repo):
-    async def get_threads(self, board):
-        return await self._get_threads(board)
+    @instrumented
+    async def get_threads(self, board, limit, cursor: typing.Optional[str] = None):
+        threads = await self._get_threads(
+            board, self._get_threads_stmt(board, limit, cursor)
+        )
+
+        next_cursor = None
+        if len(threads) > limit:
+            threads = threads[:limit]
+            next_cursor = encode_cursor(
+                threads[-1]["last_update"].isoformat(), threads[-1]["id"]
+            )
+        return {"threads": threads, "next": next_cursor}
+
+    @instrumented
+    async def get_threads_json(self, board, limit, cursor: typing.Optional[str] = None):
+        """Like ``get_threads``, but ``threads`` is json text encoded by the db."""
+        page = self._get_threads_stmt(board, limit, cursor).subquery()
+        position = page.columns["position"]
+        threads_json = func.json_agg(
+            aggregate_order_by(self._thread_json(page, preview=True), position)
+        ).filter(position <= limit)
+        get_threads_stmt = sqlalchemy.Select(
+            func.coalesce(sqlalchemy.cast(threads_json, sqlalchemy.Text), "[]").label(
+                "threads"
+            ),
+            func.count().label("count"),
+            func.max(page.columns["last_update"])
+            .filter(position == limit)
+            .label("last_update"),
+            func.max(page.columns["id"]).filter(position == limit).label("id"),
+        )
+        page_json = (await self._get_threads(board, get_threads_stmt))[0]
+
+        next_cursor = None
+        if page_json["count"] > limit:
+            next_cursor = encode_cursor(
+                page_json["last_update"].isoformat(), page_json["id"]
+            )
+        return {"threads": page_json["threads"], "next": next_cursor}
+
+    def _get_threads_stmt(self, board, limit, cursor: typing.Optional[str] = None):
+        """A board page, read from the summaries alone."""
+        bump_time = thread_summaries_table.columns["bump_time"]
+        thread_id = thread_summaries_table.columns["thread"]
+        get_threads_stmt = (
+            sqlalchemy.Select(
+                thread_summaries_table.columns["text"],
+                thread_id.label("id"),
+                bump_time.label("last_update"),
+                thread_summaries_table.columns["media"],
+                thread_summaries_table.columns["preview_posts"].label("posts"),
+                thread_summaries_table.columns["post_count"],
+                thread_summaries_table.columns["media_count"],
+                func.row_number()
+                .over(order_by=(bump_time.desc(), thread_id.desc()))
+                .label("position"),
+            )
+            .where(thread_summaries_table.columns["board"] == board)
+            .order_by(bump_time.desc(), thread_id.desc())
+            .limit(limit + 1)
+        )
+        if cursor is not None:
+            get_threads_stmt = get_threads_stmt.where(
+                sqlalchemy.tuple_(bump_time, thread_id)
+                < sqlalchemy.tuple_(*self._decode_cursor(cursor))
+            )
+        return get_threads_stmt
 
-    async def _get_threads(
-        self, board, thread_id: typing.Optional[int] = None, post_limit=3
+    @staticmethod
+    def _decode_cursor(cursor):
+        last_update, thread_id = decode_cursor(cursor, 2)
+        try:
+            return datetime.datetime.fromisoformat(last_update), int(thread_id)
+        except (TypeError, ValueError):
+            raise InvalidCursor
+
+    @instrumented
+    async def search_threads(
+        self, board, query, limit, cursor: typing.Optional[str] = None
+    ):
+        """Threads of a board matching ``query``, the best matches first.
+
+        ``query`` is in web search syntax: quoted phrases, ``or`` and ``-`` to
+        exclude words. Archived threads are found too.
+        """
+        threads = await self._get_threads(
+            board, self._search_threads_stmt(board, query, limit, cursor)
+        )
+
+        next_cursor = None
+        if len(threads) > limit:
+            threads = threads[:limit]
+            next_cursor = encode_cursor(threads[-1]["rank"], threads[-1]["id"])
+        return {"threads": threads, "next": next_cursor}
+
+    def _search_threads_stmt(
+        self, board, query, limit, cursor: typing.Optional[str] = None
     ):
-        async with self.db_engine.begin() as conn:
-            get_board_stmt = sqlalchemy.Select(boards_table).where(
-                boards_table.columns["slug"] == board
+        """Matches are found through the gin index, then all of them are ranked."""
+        search_vector = threads_table.columns["search_vector"]
+        thread_id = threads_table.columns["id"]
+        tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+        rank = func.ts_rank(search_vector, tsquery)
+        search_threads_stmt = (
+            sqlalchemy.Select(
+                thread_id,
+                threads_table.columns["text"],
+                self._select_thread_media().label("media"),
+                rank.label("rank"),
             )
-            if (await conn.execute(get_board_stmt)).rowcount == 0:
-                raise BoardNotExists
+            .where(
+                threads_table.columns["board"] == board,
+                search_vector.bool_op("@@")(tsquery),
+            )
+            .order_by(rank.desc(), thread_id.desc())
+            .limit(limit + 1)
+        )
+        if cursor is not None:
+            search_threads_stmt = search_threads_stmt.where(
+                sqlalchemy.tuple_(rank, thread_id)
+                < sqlalchemy.tuple_(*self._decode_search_cursor(cursor))
+            )
+        return search_threads_stmt
+
+    @staticmethod
+    def _decode_search_cursor(cursor):
+        rank, thread_id = decode_cursor(cursor, 2)
+        try:
+            return float(rank), int(thread_id)
+        except (TypeError, ValueError):
+            raise InvalidCursor
 
-            get_threads_stmt = sqlalchemy.Select(
+    async def _get_threads(self, board, get_threads_stmt, primary=False):
+        """Read from a replica, or from the primary right after a board write.
+
+        Replicas may not have a write for up to ``db_replica_max_lag`` after
+        it dropped the cached pages of its board. Reading them then would
+        cache a stale page as current, and miss threads and posts clients were
+        just told about.
+        """
+        self._check_board(board)
+        if primary or self.page_cache.invalidated_within(
+            board, config.db_replica_max_lag
+        ):
+            engine = self.db_engine
+        else:
+            engine = self.read_db_engine
+        async with engine.connect() as conn:
+            threads = (await conn.execute(get_threads_stmt)).mappings().fetchall()
+        return threads
+
+    def _select_threads(self, board, posts):
+        return (
+            sqlalchemy.Select(
                 threads_table.columns["text"],
                 threads_table.columns["id"],
+                threads_table.columns["last_update"],
+                self._select_thread_media().label("media"),
+                posts.label("posts"),
+            )
+            .where(threads_table.columns["board"] == board)
+            .order_by(
+                threads_table.columns["last_update"].desc(),
+                threads_table.columns["id"].desc(),
+            )
+        )
+
+    @staticmethod
+    def _select_thread_media():
+        return func.array(
+            sqlalchemy.Select(
+                func.json_build_object(
+                    "file_id",
+                    thread_media_files_table.columns["s3_filename"],
+                    "filename",
+                    thread_media_files_table.columns["filename"],
+                    "thumbnail",
+                    thread_media_files_table.columns["thumbnail"],
+                )
+            )
+            .where(
+                thread_media_files_table.columns["thread"]
+                == threads_table.columns["id"]
+            )
+            .scalar_subquery()
+        )
+
+    def _select_posts(
+        self, limit, after_post_id: typing.Optional[int] = None, last=False
+    ):
+        select_posts_stmt = sqlalchemy.Select(
+            posts_table.columns["id"],
+            func.json_build_object(
+                "id",
+                posts_table.columns["id"],
+                "voice_message",
+                posts_table.columns["voice_message"],
+                "voice_duration",
+                posts_table.columns["voice_duration"],
+                "voice_bitrate",
+                posts_table.columns["voice_bitrate"],
+                "voice_waveform",
+                posts_table.columns["voice_waveform"],
+                "media",
                 func.array(
                     sqlalchemy.Select(
                         func.json_build_object(
                             "file_id",
-                            thread_media_files_table.columns["s3_filename"],
+                            post_media_files_table.columns["s3_filename"],
                             "filename",
-                            thread_media_files_table.columns["filename"],
+                            post_media_files_table.columns["filename"],
+                            "thumbnail",
+                            post_media_files_table.columns["thumbnail"],
                         )
-                    ).where(
-                        thread_media_files_table.columns["thread"]
-                        == threads_table.columns["id"]
                     )
-                ).label("media"),
-                func.array(
-                    sqlalchemy.Select(
-                        func.json_build_object(
-                            "id",
-                            posts_table.columns["id"],
-                            "voice_message",
-                            posts_table.columns["voice_message"],
-                            "media",
-                            func.array(
-                                sqlalchemy.Select(
-                                    func.json_build_object(
-                                        "file_id",
-                                        post_media_files_table.columns["s3_filename"],
-                                        "filename",
-                                        post_media_files_table.columns["filename"],
-                                    )
-                                ).where(
-                                    post_media_files_table.columns["post"]
-                                    == posts_table.columns["id"]
-                                )
-                            ),
-                        )
+                    .where(
+                        post_media_files_table.columns["post"]
+                        == posts_table.columns["id"]
                     )
-                    .where(posts_table.columns["thread"] == threads_table.columns["id"])
-                    .order_by("id")
-                    .limit(post_limit)
-                ).label("posts"),
-            )
-            if thread_id is not None:
-                get_threads_stmt = get_threads_stmt.where(
-                    threads_table.columns["id"] == thread_id
-                )
-            get_threads_stmt = get_threads_stmt.order_by(
-                threads_table.columns["last_update"].desc()
+                    .scalar_subquery()
+                ),
+            ).label("post"),
+        ).where(posts_table.columns["thread"] == threads_table.columns["id"])
+        if after_post_id is not None:
+            select_posts_stmt = select_posts_stmt.where(
+                posts_table.columns["id"] > after_post_id
             )
-            threads = (await conn.execute(get_threads_stmt)).mappings().fetchall()
-        return threads
+        # "last" window: take the newest posts via the index, then restore id order
+        order = posts_table.columns["id"].desc() if last else posts_table.columns["id"]
+        posts = (
+            select_posts_stmt.order_by(order)
+            .limit(limit)
+            .correlate(threads_table)
+            .subquery()
+        )
+        return func.array(
+            sqlalchemy.Select(posts.columns["post"])
+            .order_by(posts.columns["id"])
+            .scalar_subquery()
+        )
 
-    async def create_thread(self, board, files: typing.List[UploadFile], text):
-        mediafiles = []
-        for f in files:
-            file_extension = pathlib.Path(f.filename).suffix[1:]
-            if file_extension not in config.allowed_meida_extenions:
-                raise FileTypeNotSupported(
-                    f"Типы поддерживаемых медиафайлов: {', '.join(config.allowed_meida_extenions)}"
-                )
-            mediafiles.append(
-                {
-                    "s3_filename": f"{str(uuid.uuid4())}.{file_extension}",
-                    "filename": f.filename,
-                }
-            )
-            await self.s3_client.upload_fileobj(
-                f, "bucket", mediafiles[-1]["s3_filename"]
+    @instrumented
+    async def create_thread(
+        self,
+        board,
+        files: typing.List[UploadFile],
+        text,
+        file_ids: typing.Sequence[str] = (),
+    ):
+        self._check_board(board)
+        for file_id in file_ids:
+            self._check_media_extension(file_id)
+        mediafiles = list(await asyncio.gather(*map(self._new_media_file, files)))
+
+        uploads = [
+            (f, mediafile["s3_filename"]) for f, mediafile in zip(files, mediafiles)
+        ]
+        mediafiles += await self._get_uploaded_files(file_ids)
+        await self._store_files(uploads, mediafiles)
+
+        # a single statement is atomic by itself, skip BEGIN and COMMIT
+        async with self.db_engine.connect() as conn:
+            await conn.execution_options(isolation_level="AUTOCOMMIT")
+            thread = (
+                await conn.execute(self._create_thread_stmt(board, text, mediafiles))
+            ).fetchone()
+            # the board was deleted since the registry was loaded
+            if thread is None:
+                raise BoardNotExists
+        self.page_cache.invalidate(board)
+
+    def _create_thread_stmt(self, board, text, mediafiles):
+        """Create a thread with its media and summary in one statement.
+
+        Nothing is written unless the board exists. Thumbnails missing from
+        ``mediafiles`` are left to jobs. Selects the thread id.
+        """
+        new_thread = (
+            insert(threads_table)
+            .from_select(
+                ["text", "board", "last_update"],
+                sqlalchemy.Select(
+                    sqlalchemy.literal(text),
+                    boards_table.columns["slug"],
+                    func.now(),
+                ).where(boards_table.columns["slug"] == board),
             )
-        async with self.db_engine.begin() as conn:
-            get_board_stmt = sqlalchemy.Select(boards_table).where(
-                boards_table.columns["slug"] == board
+            .returning(
+                threads_table.columns["id"],
+                threads_table.columns["board"],
+                threads_table.columns["last_update"],
             )
-            if (await conn.execute(get_board_stmt)).rowcount == 0:
-                raise BoardNotExists
+            .cte("new_thread")
+        )
+        media = self._select_mediafiles(mediafiles)
+        new_media = insert(thread_media_files_table).from_select(
+            ["thread", "filename", "s3_filename", "thumbnail"],
+            sqlalchemy.Select(
+                new_thread.columns["id"],
+                media.columns["filename"],
+                media.columns["s3_filename"],
+                media.columns["thumbnail"],
+            ).select_from(new_thread.join(media, sqlalchemy.true())),
+        )
+        new_summary = insert(thread_summaries_table).from_select(
+            [
+                "thread",
+                "board",
+                "text",
+                "media",
+                "preview_posts",
+                "post_count",
+                "media_count",
+                "bump_time",
+            ],
+            sqlalchemy.Select(
+                new_thread.columns["id"],
+                new_thread.columns["board"],
+                sqlalchemy.literal(text),
+                sqlalchemy.cast(self._media_json(mediafiles), JSONB),
+                sqlalchemy.cast([], JSONB),
+                sqlalchemy.literal(0),
+                sqlalchemy.literal(len(mediafiles)),
+                new_thread.columns["last_update"],
+            ),
+        )
+
+        return sqlalchemy.Select(
+            new_thread.columns["id"],
+            self._notify(type="thread", board=board, thread=new_thread.columns["id"]),
+        ).add_cte(
+            self._reference_blobs(new_thread, mediafiles).cte("reference_blobs"),
+            new_media.cte("new_media"),
+            new_summary.cte("new_summary"),
+            self._enqueue_thumbnails(new_thread, mediafiles).cte("thumbnail_jobs"),
+        )
+
+    def _summarize_threads_stmt(self, board):
+        """Summarize the live threads of a board that have no summary yet.
 
-            create_thread_stmt = (
-                insert(threads_table)
-                .values(
-                    text=text,
-                    board=board,
-                    last_update=datetime.datetime.now(tz=datetime.timezone.utc),
+        The summaries are built by the same queries as the thread reads. For
+        rows written around the repos, like seeded ones.
+        """
+        thread = self._select_threads(board, self._select_posts(PREVIEW_POSTS))
+        thread = thread.where(
+            threads_table.columns["archived_at"].is_(None),
+            ~sqlalchemy.Select(thread_summaries_table.columns["thread"])
+            .where(
+                thread_summaries_table.columns["thread"] == threads_table.columns["id"]
+            )
+            .exists(),
+        ).subquery()
+        post_count = (
+            sqlalchemy.Select(func.count())
+            .select_from(posts_table)
+            .where(posts_table.columns["thread"] == thread.columns["id"])
+            .scalar_subquery()
+        )
+        thread_media_count = (
+            sqlalchemy.Select(func.count())
+            .select_from(thread_media_files_table)
+            .where(thread_media_files_table.columns["thread"] == thread.columns["id"])
+            .scalar_subquery()
+        )
+        post_media_count = (
+            sqlalchemy.Select(func.count())
+            .select_from(
+                post_media_files_table.join(
+                    posts_table,
+                    posts_table.columns["id"] == post_media_files_table.columns["post"],
                 )
-                .returning(threads_table.columns["id"])
             )
-            create_thread_result = await conn.execute(create_thread_stmt)
-            thread_id = create_thread_result.fetchone()[0]
+            .where(posts_table.columns["thread"] == thread.columns["id"])
+            .scalar_subquery()
+        )
+        return insert(thread_summaries_table).from_select(
+            [
+                "thread",
+                "board",
+                "text",
+                "media",
+                "preview_posts",
+                "post_count",
+                "media_count",
+                "bump_time",
+            ],
+            sqlalchemy.Select(
+                thread.columns["id"],
+                sqlalchemy.literal(board),
+                thread.columns["text"],
+                func.to_jsonb(thread.columns["media"]),
+                func.to_jsonb(thread.columns["posts"]),
+                post_count,
+                thread_media_count + post_media_count,
+                thread.columns["last_update"],
+            ),
+        )
 
-            create_thread_media_stmt = insert(thread_media_files_table)
-            for mediafile in mediafiles:
-                mediafile["thread"] = thread_id
-            await conn.execute(create_thread_media_stmt, mediafiles)
+    @instrumented
+    async def get_thread(
+        self,
+        board,
+        thread_id,
+        limit,
+        after_post_id: typing.Optional[int] = None,
+        last=False,
+    ):
+        threads = await self._get_thread(
+            board, self._get_thread_stmt(board, thread_id, limit, after_post_id, last)
+        )
+        return threads[0]
 
-            await conn.commit()
+    @instrumented
+    async def get_thread_json(
+        self,
+        board,
+        thread_id,
+        limit,
+        after_post_id: typing.Optional[int] = None,
+        last=False,
+    ):
+        """Like ``get_thread``, but json text encoded by the db."""
+        thread = self._get_thread_stmt(
+            board, thread_id, limit, after_post_id, last
+        ).subquery()
+        threads = await self._get_thread(
+            board,
+            sqlalchemy.Select(
+                sqlalchemy.cast(self._thread_json(thread), sqlalchemy.Text).label(
+                    "thread"
+                )
+            ),
+        )
+        return threads[0]["thread"]
 
-    async def get_thread(self, board, thread_id):
-        threads = await self._get_threads(board, thread_id, 10**6)  # TODO rid off const
+    async def _get_thread(self, board, get_thread_stmt):
+        threads = await self._get_threads(board, get_thread_stmt)
+        # a new thread may not be on the replica yet
+        if len(threads) == 0 and self.resources["db_healthy_replicas"]:
+            threads = await self._get_threads(board, get_thread_stmt, primary=True)
         if len(threads) == 0:
             raise ThreadNotExists
-        return threads[0]
+        return threads
+
+    @instrumented
+    async def archive_threads(self, bump_limit, max_age, batch_size):
+        """Take threads past ``bump_limit`` posts or ``max_age`` seconds off their boards.
+
+        Archived threads stay readable through ``get_thread`` but take no new
+        posts. Returns how many threads were archived.
+        """
+        archived = 0
+        while True:
+            async with self.db_engine.begin() as conn:
+                boards = (
+                    (
+                        await conn.execute(
+                            self._archive_threads_stmt(bump_limit, max_age, batch_size)
+                        )
+                    )
+                    .scalars()
+                    .all()
+                )
+            for board in set(boards):
+                self.page_cache.invalidate(board)
+            archived += len(boards)
+            if len(boards) < batch_size:
+                return archived
+
+    @instrumented
+    async def archive_threads_periodically(
+        self, interval, bump_limit, max_age, batch_size
+    ):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with self.db_engine.connect() as conn:
+                    lock_stmt = sqlalchemy.Select(
+                        func.pg_try_advisory_lock(ARCHIVE_THREADS_LOCK)
+                    )
+                    if not (await conn.execute(lock_stmt)).scalar():
+                        continue
+                    try:
+                        archived = await self.archive_threads(
+                            bump_limit, max_age, batch_size
+                        )
+                        if archived:
+                            logger.info("Archived %d threads", archived)
+                    finally:
+                        unlock_stmt = sqlalchemy.Select(
+                            func.pg_advisory_unlock(ARCHIVE_THREADS_LOCK)
+                        )
+                        await conn.execute(unlock_stmt)
+            except Exception:
+                logger.exception("Failed to archive threads")
+
+    def _archive_threads_stmt(self, bump_limit, max_age, batch_size):
+        """Archive a batch of threads, selects the board of every one.
+
+        Threads are locked before their summaries, in the order create_post
+        locks them.
+        """
+        expired_threads = (
+            sqlalchemy.Select(thread_summaries_table.columns["thread"])
+            .where(
+                sqlalchemy.or_(
+                    thread_summaries_table.columns["post_count"] >= bump_limit,
+                    thread_summaries_table.columns["bump_time"]
+                    < func.now() - datetime.timedelta(seconds=max_age),
+                )
+            )
+            .limit(batch_size)
+        )
+        archived_threads = (
+            sqlalchemy.Update(threads_table)
+            .where(
+                threads_table.columns["id"].in_(expired_threads),
+                threads_table.columns["archived_at"].is_(None),
+            )
+            .values(archived_at=func.now())
+            .returning(threads_table.columns["id"], threads_table.columns["board"])
+            .cte("archived_threads")
+        )
+        delete_summaries = sqlalchemy.Delete(thread_summaries_table).where(
+            thread_summaries_table.columns["thread"] == archived_threads.columns["id"],
+            thread_summaries_table.columns["board"]
+            == archived_threads.columns["board"],
+        )
+        return sqlalchemy.Select(
+            archived_threads.columns["board"],
+            self._notify(
+                type="archived",
+                board=archived_threads.columns["board"],
+                thread=archived_threads.columns["id"],
+            ),
+        ).add_cte(delete_summaries.cte("delete_summaries"))
+
+    @staticmethod
+    def _thread_json(thread, preview=False):
+        """The thread json of a thread row, in the field order of the api models."""
+        fields = ["id", "text", "media", "posts"]
+        if preview:
+            fields += ["post_count", "media_count"]
+        return func.json_build_object(
+            *(arg for field in fields for arg in (field, thread.columns[field]))
+        )
+
+    @instrumented
+    async def get_board(self, thread_id):
+        """The board of a thread, ``None`` if there is no such thread.
+
+        Read from the primary, replicas may not have a new thread yet.
+        """
+        board = self.thread_boards.get(thread_id)
+        if board is not None:
+            return board
+        async with self.db_engine.connect() as conn:
+            get_board_stmt = sqlalchemy.Select(threads_table.columns["board"]).where(
+                threads_table.columns["id"] == thread_id
+            )
+            board = (await conn.execute(get_board_stmt)).scalar()
+        if board is not None:
+            if len(self.thread_boards) >= THREAD_BOARDS_CACHE_SIZE:
+                del self.thread_boards[next(iter(self.thread_boards))]
+            self.thread_boards[thread_id] = board
+        return board
+
+    @instrumented
+    async def check_thread(self, board, thread_id):
+        self._check_board(board)
+        async with self.db_engine.connect() as conn:
+            get_thread_stmt = sqlalchemy.Select(threads_table.columns["id"]).where(
+                threads_table.columns["id"] == thread_id,
+                threads_table.columns["board"] == board,
+            )
+            if (await conn.execute(get_thread_stmt)).scalar() is None:
+                raise ThreadNotExists
+
+    def _get_thread_stmt(
+        self,
+        board,
+        thread_id,
+        limit,
+        after_post_id: typing.Optional[int] = None,
+        last=False,
+    ):
+        return self._select_threads(
+            board, self._select_posts(limit, after_post_id, last)
+        ).where(threads_table.columns["id"] == thread_id)
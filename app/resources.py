@@ -1,42 +1,131 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import asynccontextmanager
 
 import aioboto3
 import aioboto3.s3
 import botocore
 import botocore.exceptions
+from boto3.s3.transfer import TransferConfig
 from fastapi import FastAPI
-from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import create_async_engine
 
+from app.admission import WriteAdmission
 from app.config import config
-from app.db_schema import boards_table
+from app.events import EventBus, listen_events
+from app.media_cache import process_media_cache
+from app.metrics import (
+    TimedPool,
+    instrument_engine,
+    instrument_s3_client,
+    register_pool_collector,
+)
+from app.page_cache import PageCache
+from app.replicas import monitor_replicas
+from app.repositories import BoardRepo, FileRepo, ThreadRepo
 
 resources = {
-    "db_engine": create_async_engine(config.db_uri),
+    "db_engine": instrument_engine(
+        create_async_engine(
+            config.db_uri,
+            poolclass=TimedPool,
+            pool_logging_name="primary",
+            **config.db_engine_options,
+        )
+    ),
+    "db_replica_engines": [
+        instrument_engine(
+            create_async_engine(
+                uri,
+                poolclass=TimedPool,
+                pool_logging_name=f"replica{i}",
+                **config.db_engine_options,
+            )
+        )
+        for i, uri in enumerate(config.db_replica_uris)
+    ],
+    "db_healthy_replicas": [],
+    "page_cache": PageCache(config.page_cache_ttl, config.page_cache_size),
+    "write_admission": WriteAdmission(
+        config.write_client_rate,
+        config.write_client_burst,
+        config.write_board_rate,
+        config.write_board_burst,
+        config.write_max_in_flight,
+    ),
+    # boards of threads, they never move
+    "thread_boards": {},
+    "event_bus": EventBus(config.events_queue_size),
+    "s3_upload_semaphore": asyncio.Semaphore(config.s3_max_concurrent_uploads),
+    "s3_transfer_config": TransferConfig(
+        multipart_threshold=config.s3_multipart_chunksize,
+        multipart_chunksize=config.s3_multipart_chunksize,
+        max_concurrency=config.s3_upload_concurrency,
+    ),
+    "media_cache": (
+        process_media_cache(config.media_cache_dir, config.media_cache_max_bytes)
+        if config.media_cache_dir
+        else None
+    ),
+}
+register_pool_collector(resources)
+
+s3_settings = {
+    "aws_access_key_id": config.s3_access_key_id,
+    "aws_secret_access_key": config.s3_secret_access_key,
+    "endpoint_url": config.s3_url,
 }
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    async with resources["db_engine"].begin() as conn:
-        create_b_board_stmt = (
-            insert(boards_table)
-            .values(slug="b", name="Бред")
-            .on_conflict_do_nothing(index_elements=["slug"])
+    board_repo = BoardRepo(resources)
+    await board_repo.create_board("b", "Бред")
+    refresh_boards_task = asyncio.create_task(
+        board_repo.refresh_boards(config.boards_refresh_interval)
+    )
+    monitor_replicas_task = asyncio.create_task(
+        monitor_replicas(
+            resources, config.db_replica_check_interval, config.db_replica_max_lag
+        )
+    )
+    listen_events_task = asyncio.create_task(
+        listen_events(resources, config.events_check_interval)
+    )
+    archive_threads_task = asyncio.create_task(
+        ThreadRepo(resources).archive_threads_periodically(
+            config.archive_interval,
+            config.archive_bump_limit,
+            config.archive_max_age,
+            config.archive_batch_size,
         )
-        await conn.execute(create_b_board_stmt)
+    )
+
+    resources["process_pool"] = ProcessPoolExecutor(
+        config.thumbnail_workers, mp_context=multiprocessing.get_context("spawn")
+    )
 
     boto_session = aioboto3.Session()
-    s3_settings = {
-        "aws_access_key_id": config.s3_access_key_id,
-        "aws_secret_access_key": config.s3_secret_access_key,
-        "endpoint_url": config.s3_url,
-    }
     async with boto_session.client(service_name="s3", **s3_settings) as s3:
         try:
             await s3.create_bucket(Bucket="bucket")
         except botocore.exceptions.ClientError as e:
             if e.response["Error"]["Code"] != "BucketAlreadyOwnedByYou":
                 raise e
-        resources["s3"] = s3
-        yield
+        resources["s3"] = instrument_s3_client(s3)
+        async with boto_session.client(
+            service_name="s3",
+            **{**s3_settings, "endpoint_url": config.s3_public_url or config.s3_url},
+        ) as s3_presign:
+            resources["s3_presign"] = s3_presign
+            reap_orphans_task = asyncio.create_task(
+                FileRepo(resources).reap_orphans_periodically(config.s3_reaper_interval)
+            )
+            yield
+            reap_orphans_task.cancel()
+    refresh_boards_task.cancel()
+    monitor_replicas_task.cancel()
+    listen_events_task.cancel()
+    archive_threads_task.cancel()
+    resources["process_pool"].shutdown(cancel_futures=True)
@@ -0,0 +1,23 @@
+import io
+import pathlib
+import typing
+
+from PIL import Image
+
+
+def thumbnail_name(s3_filename: str) -> str:
+    return f"{pathlib.Path(s3_filename).stem}_thumb.jpg"
+
+
+def make_thumbnail(data: bytes, size: int) -> typing.Optional[bytes]:
+    """Downscale an image to fit ``size``x``size`` jpeg, runs in the process pool."""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # lets the jpeg decoder skip most of the pixels of big photos
+            image.draft("RGB", (size, size))
+            image.thumbnail((size, size))
+            thumbnail = io.BytesIO()
+            image.convert("RGB").save(thumbnail, "JPEG", quality=80, optimize=True)
+    except (OSError, Image.DecompressionBombError):
+        return None
+    return thumbnail.getvalue()
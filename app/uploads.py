@@ -0,0 +1,78 @@
+from fastapi import HTTPException, responses
+
+from app.config import config
+from app.voice import parse_header
+
+# enough for every signature below
+SNIFF_BYTES = 16
+
+
+def max_file_bytes(media_type: str) -> int:
+    if media_type == "audio/mpeg":
+        return config.upload_max_voice_bytes
+    return config.upload_max_image_bytes
+
+
+def sniff(head: bytes, media_type: str) -> bool:
+    """Whether the first ``SNIFF_BYTES`` of a file look like ``media_type``."""
+    if media_type == "image/jpeg":
+        return head.startswith(b"\xff\xd8\xff")
+    if media_type == "image/x-png":
+        return head.startswith(b"\x89PNG\r\n\x1a\n")
+    if media_type == "audio/mpeg":
+        return head.startswith(b"ID3") or parse_header(head[:4]) is not None
+    return False
+
+
+class BodySizeLimitMiddleware:
+    """Reject request bodies over ``max_bytes`` with 413 before they are read.
+
+    Bodies without a content length are counted while the app receives them
+    and the request is aborted as soon as the limit is crossed, so nothing
+    over it is spooled to disk.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None:
+            # digits only, int() would take signs, spaces and underscores too
+            if not content_length.isdigit():
+                return await self._reject(
+                    scope, receive, send, 400, "Invalid Content-Length"
+                )
+            if int(content_length) > self.max_bytes:
+                return await self._reject(
+                    scope, receive, send, 413, "Request is too large"
+                )
+
+        received = 0
+
+        async def receive_limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail="Request is too large",
+                    )
+            return message
+
+        await self.app(scope, receive_limited, send)
+
+    @staticmethod
+    async def _reject(scope, receive, send, status_code, detail):
+        response = responses.JSONResponse(
+            {"detail": detail},
+            status_code=status_code,
+            headers={"Connection": "close"},
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,132 @@
+import typing
+
+# kbps by bitrate index, layer III
+BITRATES = {
+    "mpeg1": (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    "mpeg2": (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+SAMPLE_RATES = {
+    "mpeg1": (44100, 48000, 32000),
+    "mpeg2": (22050, 24000, 16000),
+    "mpeg2.5": (11025, 12000, 8000),
+}
+VERSIONS = {0b00: "mpeg2.5", 0b10: "mpeg2", 0b11: "mpeg1"}
+
+
+class FrameHeader(typing.NamedTuple):
+    version: str
+    bitrate: int
+    sample_rate: int
+    samples: int
+    length: int
+    crc: bool
+    channels: int
+
+
+def parse_header(header: bytes) -> typing.Optional[FrameHeader]:
+    """The layer III frame header in the first 4 bytes, if they are one."""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = VERSIONS.get(header[1] >> 3 & 0b11)
+    layer = header[1] >> 1 & 0b11
+    bitrate_index = header[2] >> 4
+    sample_rate_index = header[2] >> 2 & 0b11
+    # free format bitrates aren't supported
+    if version is None or layer != 0b01 or bitrate_index in (0, 15):
+        return None
+    if sample_rate_index == 3:
+        return None
+    bitrate = BITRATES["mpeg1" if version == "mpeg1" else "mpeg2"][bitrate_index]
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+    samples = 1152 if version == "mpeg1" else 576
+    padding = header[2] >> 1 & 1
+    return FrameHeader(
+        version=version,
+        bitrate=bitrate,
+        sample_rate=sample_rate,
+        samples=samples,
+        length=samples // 8 * bitrate * 1000 // sample_rate + padding,
+        crc=not header[1] & 1,
+        channels=1 if header[3] >> 6 == 0b11 else 2,
+    )
+
+
+def audio_bits(frame: memoryview, header: FrameHeader) -> int:
+    """Bits of huffman coded audio in a frame, from part2_3_length of the side info.
+
+    Silent granules carry none, the encoder spends more on louder and busier
+    sound.
+    """
+    offset = 4 + 2 * header.crc
+    side_info = int.from_bytes(frame[offset : offset + 32], "big")
+    size = min(len(frame) - offset, 32) * 8
+    if header.version == "mpeg1":
+        # main_data_begin, private bits and scfsi
+        position = 9 + (5 if header.channels == 1 else 3) + 4 * header.channels
+        granules, granule_bits = 2, 59
+    else:
+        position = 8 + (1 if header.channels == 1 else 2)
+        granules, granule_bits = 1, 63
+    bits = 0
+    for _ in range(granules * header.channels):
+        if position + granule_bits > size:
+            break
+        bits += side_info >> (size - position - 12) & 0xFFF
+        position += granule_bits
+    return bits
+
+
+def frames(data: bytes) -> typing.Iterator[typing.Tuple[FrameHeader, memoryview]]:
+    """The layer III frames of an mp3 file, skipping tags and garbage between them."""
+    data = memoryview(data)
+    offset = 0
+    if bytes(data[:3]) == b"ID3" and len(data) >= 10:
+        # syncsafe size, 7 bits per byte, plus the footer if present
+        size = 0
+        for byte in data[6:10]:
+            size = size << 7 | byte & 0x7F
+        offset = 10 + size + (10 if data[5] & 0x10 else 0)
+    while offset + 4 <= len(data):
+        header = parse_header(data[offset : offset + 4])
+        if header is None or offset + header.length > len(data):
+            offset += 1
+            continue
+        yield header, data[offset : offset + header.length]
+        offset += header.length
+
+
+def parse_voice(data: bytes, peaks: int) -> typing.Optional[dict]:
+    """Duration, bitrate and waveform of an mp3, runs in the process pool.
+
+    Only the frame headers and side info are read, nothing is decoded. The
+    waveform has up to ``peaks`` values from 0 to 255: how much audio every
+    stretch of the file carries, relative to the busiest one, so silence is
+    flat. Returns ``None`` if there are no frames.
+    """
+    duration = 0.0
+    size = 0
+    levels = []
+    for header, frame in frames(data):
+        side_info = bytes(frame[:64])
+        # the xing/info frame of vbr files carries no audio
+        if not levels and (b"Xing" in side_info or b"Info" in side_info):
+            continue
+        duration += header.samples / header.sample_rate
+        size += header.length
+        levels.append(audio_bits(frame, header) / header.samples)
+    if not levels:
+        return None
+
+    peaks = min(peaks, len(levels))
+    waveform = [
+        max(levels[i * len(levels) // peaks : (i + 1) * len(levels) // peaks])
+        for i in range(peaks)
+    ]
+    loudest = max(waveform)
+    return {
+        "duration": duration,
+        "bitrate": round(size * 8 / duration / 1000),
+        "waveform": [
+            round(peak / loudest * 255) if loudest else 0 for peak in waveform
+        ],
+    }
@@ -0,0 +1,49 @@
+"""Run the background jobs queued by the writes.
+
+    python -m app.worker
+
+Any number of workers can run next to the app, every job is taken by one
+of them.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import signal
+from concurrent.futures import ProcessPoolExecutor
+
+import aioboto3
+
+from app.config import config
+from app.metrics import instrument_s3_client
+from app.repositories import FileRepo, JobRepo, PostRepo
+from app.resources import resources, s3_settings
+
+
+async def run_worker():
+    resources["process_pool"] = ProcessPoolExecutor(
+        config.thumbnail_workers, mp_context=multiprocessing.get_context("spawn")
+    )
+    try:
+        async with aioboto3.Session().client(service_name="s3", **s3_settings) as s3:
+            resources["s3"] = instrument_s3_client(s3)
+            handlers = {
+                "voice_metadata": PostRepo(resources).update_voice_metadata,
+                "thumbnail": FileRepo(resources).create_thumbnail,
+            }
+            await JobRepo(resources).run_jobs_periodically(
+                handlers, config.job_poll_interval, config.job_batch_size
+            )
+    finally:
+        resources["process_pool"].shutdown(cancel_futures=True)
+        await resources["db_engine"].dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    # stop like on ctrl-c, jobs cut short run again once their lease is over
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        asyncio.run(run_worker())
+    except KeyboardInterrupt:
+        pass
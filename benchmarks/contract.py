@@ -0,0 +1,106 @@
+"""Check that the raw json reads match the validated response models.
+
+    python -m benchmarks.seed && python -m benchmarks.contract
+
+Board pages and threads are read both through the pydantic models and as
+the json the database encodes (``raw_json_reads``). The exit status is
+non-zero if any of them differ, or if the raw json doesn't round trip
+through the models unchanged.
+"""
+
+import asyncio
+import json
+import sys
+
+import sqlalchemy
+
+from app.db_schema import posts_table
+from app.main import Thread, ThreadPage, encode_raw_thread_page
+from app.repositories import BoardRepo, ThreadRepo
+from app.resources import resources
+
+
+def check(name, model, validated, raw):
+    validated = json.loads(model.model_validate(validated).model_dump_json())
+    raw = json.loads(raw)
+    if raw != validated:
+        print(f"FAIL {name}: raw json differs from the model")
+        return False
+    if json.loads(model.model_validate(raw).model_dump_json()) != raw:
+        print(f"FAIL {name}: raw json doesn't round trip through the model")
+        return False
+    return True
+
+
+async def check_board(board):
+    thread_repo = ThreadRepo(resources)
+    failed = 0
+    checked = 0
+    for limit in (1, 20, 100):
+        cursor = None
+        # the first few pages, following the cursors
+        for page_number in range(3):
+            validated = await thread_repo.get_threads(board, limit, cursor)
+            raw = await thread_repo.get_threads_json(board, limit, cursor)
+            name = f"{board} page {page_number} (limit {limit})"
+            failed += not check(
+                name, ThreadPage, validated, encode_raw_thread_page(raw)
+            )
+            checked += 1
+            for thread in validated["threads"][:5]:
+                failed += not await check_thread(board, thread["id"])
+                checked += 1
+            cursor = validated["next"]
+            if cursor is None:
+                break
+    return checked, failed
+
+
+async def check_thread(board, thread_id):
+    thread_repo = ThreadRepo(resources)
+    async with resources["db_engine"].connect() as conn:
+        first_post = (
+            await conn.execute(
+                sqlalchemy.Select(sqlalchemy.func.min(posts_table.columns["id"])).where(
+                    posts_table.columns["thread"] == thread_id
+                )
+            )
+        ).scalar()
+    windows = [
+        {"limit": 100},
+        {"limit": 2, "last": True},
+        {"limit": 100, "after_post_id": first_post or 0},
+    ]
+    ok = True
+    for window in windows:
+        args = (
+            board,
+            thread_id,
+            window["limit"],
+            window.get("after_post_id"),
+            window.get("last", False),
+        )
+        ok &= check(
+            f"{board} thread {thread_id} {window}",
+            Thread,
+            await thread_repo.get_thread(*args),
+            await thread_repo.get_thread_json(*args),
+        )
+    return ok
+
+
+async def check_contract():
+    board_repo = BoardRepo(resources)
+    await board_repo.load_boards()
+    checked = failed = 0
+    for board in await board_repo.get_boards():
+        board_checked, board_failed = await check_board(board["slug"])
+        checked += board_checked
+        failed += board_failed
+    print(f"{checked - failed}/{checked} reads match")
+    await resources["db_engine"].dispose()
+    return not failed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(check_contract()) else 1)
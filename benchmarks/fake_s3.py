@@ -0,0 +1,133 @@
+"""An in-memory stand-in for the aioboto3 s3 client.
+
+Implements only the calls the repositories make, with the same argument
+names, response keys and error codes, so the app can run without minio.
+Every call can be delayed by a fixed ``latency`` to model the network.
+"""
+
+import asyncio
+import datetime
+import inspect
+import re
+
+from botocore.exceptions import ClientError
+
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+def client_error(code, operation, **extra):
+    return ClientError({"Error": {"Code": code, **extra}}, operation)
+
+
+class FakeBody:
+    def __init__(self, data):
+        self.data = data
+
+    async def read(self):
+        return self.data
+
+    async def iter_chunks(self, chunk_size=1024):
+        for i in range(0, len(self.data), chunk_size):
+            yield self.data[i : i + chunk_size]
+
+
+class FakePaginator:
+    def __init__(self, s3, page_size=1000):
+        self.s3 = s3
+        self.page_size = page_size
+
+    async def paginate(self, Bucket):
+        await self.s3._delay()
+        objects = sorted(self.s3.objects.items())
+        for i in range(0, len(objects), self.page_size):
+            yield {
+                "Contents": [
+                    {"Key": key, "Size": len(data), "LastModified": last_modified}
+                    for key, (data, _, last_modified) in objects[i : i + self.page_size]
+                ]
+            }
+
+
+class FakeS3:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        # key -> (data, metadata, last modified)
+        self.objects = {}
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _put(self, key, data, metadata):
+        self.objects[key] = (
+            data,
+            metadata,
+            datetime.datetime.now(tz=datetime.timezone.utc),
+        )
+
+    def _get(self, key, operation):
+        try:
+            return self.objects[key]
+        except KeyError:
+            # head_object has no body to carry an error code
+            code = "404" if operation == "HeadObject" else "NoSuchKey"
+            raise client_error(code, operation)
+
+    async def create_bucket(self, Bucket):
+        return {}
+
+    async def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Config=None):
+        await self._delay()
+        data = Fileobj.read()
+        if inspect.isawaitable(data):
+            data = await data
+        self._put(Key, data, (ExtraArgs or {}).get("Metadata", {}))
+
+    async def get_object(self, Bucket, Key, Range=None):
+        await self._delay()
+        data, metadata, _ = self._get(Key, "GetObject")
+        response = {"Metadata": metadata, "ContentLength": len(data)}
+        if Range:
+            match = RANGE_RE.match(Range)
+            if match is None or match.groups() == ("", ""):
+                raise client_error(
+                    "InvalidRange", "GetObject", ActualObjectSize=str(len(data))
+                )
+            start, end = match.groups()
+            if start:
+                start, end = int(start), min(int(end or len(data) - 1), len(data) - 1)
+            else:
+                start, end = max(len(data) - int(end), 0), len(data) - 1
+            if start >= len(data) or start > end:
+                raise client_error(
+                    "InvalidRange", "GetObject", ActualObjectSize=str(len(data))
+                )
+            response["ContentRange"] = f"bytes {start}-{end}/{len(data)}"
+            data = data[start : end + 1]
+            response["ContentLength"] = len(data)
+        response["Body"] = FakeBody(data)
+        return response
+
+    async def head_object(self, Bucket, Key):
+        await self._delay()
+        data, metadata, _ = self._get(Key, "HeadObject")
+        return {"Metadata": metadata, "ContentLength": len(data)}
+
+    async def copy_object(self, Bucket, Key, CopySource):
+        await self._delay()
+        data, metadata, _ = self._get(CopySource["Key"], "CopyObject")
+        self._put(Key, data, metadata)
+        return {}
+
+    async def delete_objects(self, Bucket, Delete):
+        await self._delay()
+        for s3_object in Delete["Objects"]:
+            self.objects.pop(s3_object["Key"], None)
+        return {}
+
+    async def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        return f"http://fake-s3/{Params['Bucket']}/{Params['Key']}"
+
+    def get_paginator(self, operation_name):
+        assert operation_name == "list_objects_v2"
+        return FakePaginator(self)
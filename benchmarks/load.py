@@ -0,0 +1,281 @@
+"""Load the hot endpoints concurrently and report latency percentiles.
+
+    python -m benchmarks.seed
+    python -m benchmarks.load --duration 30 --concurrency 32 --save baseline.json
+    python -m benchmarks.load --duration 30 --concurrency 32 --baseline baseline.json
+
+By default the app runs in-process against the database from the app config
+and stores files in memory (``benchmarks.fake_s3``), so only postgres is
+needed. The background tasks of the app lifespan don't run. Pass ``--url`` to
+load a running deployment instead. With ``--baseline`` the exit status is
+non-zero if the p95 latency of any operation or the total throughput
+regressed.
+
+The seed of the random operation mix is reported and saved, ``--seed`` repeats
+it. Concurrent requests still interleave differently from run to run.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import random
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+from PIL import Image
+
+from app.admission import WriteAdmission
+from app.config import config
+from app.main import app
+from app.repositories import BoardRepo
+from app.resources import resources
+from benchmarks import report
+from benchmarks.fake_s3 import FakeS3
+
+# relative frequency of every operation, roughly what a board sees
+WEIGHTS = {
+    "list board": 40,
+    "view thread": 35,
+    "download file": 15,
+    "search": 5,
+    "create post": 8,
+    "create thread": 2,
+}
+
+
+def make_image():
+    image = Image.effect_noise((640, 480), 64).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+# only files of threads created by this run exist, seeded media rows and earlier
+# runs have no objects in the in-memory s3
+THREAD_TEXT = f"benchmark thread {uuid.uuid4()}"
+# a single silent mpeg-1 layer 3 frame
+VOICE = b"\xff\xfb\x90\x00" + bytes(413)
+# share of the uploaded images that repost one already stored
+REPOSTS = 0.2
+
+
+def unique(data):
+    """``data`` with some trailing bytes, so it is stored as new content."""
+    return data + uuid.uuid4().bytes
+
+
+class Workload:
+    def __init__(self, client: httpx.AsyncClient, boards):
+        self.client = client
+        self.boards = boards
+        # the noise is the same every run, and blobs of earlier runs are
+        # skipped but have no objects in the in-memory s3
+        self.image = unique(make_image())
+        self.threads = []
+        self.texts = []
+        self.cursors = []
+        self.file_ids = []
+
+    async def setup(self, files):
+        """Collect threads to view and create files to download."""
+        for _ in range(files):
+            await self.create_thread()
+        for board in self.boards:
+            response = await self.client.get(f"/api/v0/{board}/thread")
+            response.raise_for_status()
+            self._remember_page(board, response.json())
+        if not self.threads:
+            sys.exit("No threads to load, run python -m benchmarks.seed first")
+
+    def _remember_page(self, board, page):
+        for thread in page["threads"]:
+            self.threads.append((board, thread["id"]))
+            if len(self.texts) < 1000:
+                self.texts.append((board, thread["text"]))
+            if thread["text"] == THREAD_TEXT:
+                self.file_ids.extend(media["file_id"] for media in thread["media"])
+        if page["next"] and len(self.cursors) < 1000:
+            self.cursors.append((board, page["next"]))
+
+    def upload_image(self):
+        return self.image if random.random() < REPOSTS else unique(self.image)
+
+    async def list_board(self):
+        # half of the listings follow a cursor deeper into the board
+        if self.cursors and random.random() < 0.5:
+            board, cursor = random.choice(self.cursors)
+            params = {"cursor": cursor}
+        else:
+            board, params = random.choice(self.boards), {}
+        response = await self.client.get(f"/api/v0/{board}/thread", params=params)
+        if response.status_code == 200:
+            self._remember_page(board, response.json())
+        return response.status_code == 200
+
+    async def view_thread(self):
+        board, thread_id = random.choice(self.threads)
+        response = await self.client.get(f"/api/v0/{board}/thread/{thread_id}")
+        return response.status_code == 200
+
+    async def download_file(self):
+        if not self.file_ids:
+            return True
+        response = await self.client.get(f"/api/v0/file/{random.choice(self.file_ids)}")
+        return response.status_code in (200, 302)
+
+    async def search(self):
+        # the text of a known thread, so there is at least one match
+        board, text = random.choice(self.texts)
+        response = await self.client.get(f"/api/v0/{board}/search", params={"q": text})
+        return response.status_code == 200
+
+    async def create_post(self):
+        _, thread_id = random.choice(self.threads)
+        response = await self.client.post(
+            f"/api/v0/{thread_id}/post",
+            files=[
+                ("voice", ("voice.mp3", unique(VOICE), "audio/mpeg")),
+                ("files", ("image.jpg", self.upload_image(), "image/jpeg")),
+            ],
+        )
+        return response.status_code == 201
+
+    async def create_thread(self):
+        response = await self.client.post(
+            f"/api/v0/{random.choice(self.boards)}/thread",
+            data={"text": THREAD_TEXT},
+            files=[("files", ("image.jpg", self.upload_image(), "image/jpeg"))],
+        )
+        return response.status_code == 201
+
+    def operations(self):
+        return {
+            "list board": self.list_board,
+            "view thread": self.view_thread,
+            "download file": self.download_file,
+            "search": self.search,
+            "create post": self.create_post,
+            "create thread": self.create_thread,
+        }
+
+
+async def worker(workload, deadline, samples):
+    operations = workload.operations()
+    names, weights = list(WEIGHTS), list(WEIGHTS.values())
+    while time.perf_counter() < deadline:
+        name = random.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            ok = await operations[name]()
+        except httpx.HTTPError:
+            ok = False
+        if samples is not None:
+            samples.setdefault(name, []).append((time.perf_counter() - start, ok))
+
+
+@contextlib.asynccontextmanager
+async def local_client(s3_latency):
+    """Run the app in-process with the in-memory s3."""
+    resources["s3"] = resources["s3_presign"] = FakeS3(s3_latency)
+    resources["process_pool"] = ProcessPoolExecutor(
+        config.thumbnail_workers, mp_context=multiprocessing.get_context("spawn")
+    )
+    # every request comes from the same client, only the in-flight cap applies
+    resources["write_admission"] = WriteAdmission(
+        client_rate=0,
+        client_burst=config.write_client_burst,
+        board_rate=0,
+        board_burst=config.write_board_burst,
+        max_in_flight=config.write_max_in_flight,
+    )
+    await BoardRepo(resources).load_boards()
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://benchmark"
+        ) as client:
+            yield client
+    finally:
+        resources["process_pool"].shutdown(cancel_futures=True)
+        await resources["db_engine"].dispose()
+
+
+@contextlib.asynccontextmanager
+async def remote_client(url, concurrency):
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        yield client
+
+
+async def run(args):
+    if args.url:
+        client_context = remote_client(args.url, args.concurrency)
+    else:
+        client_context = local_client(args.s3_latency)
+    async with client_context as client:
+        boards = args.board or [
+            board["slug"] for board in (await client.get("/api/v0/board")).json()
+        ]
+        workload = Workload(client, boards)
+        await workload.setup(args.files)
+
+        deadline = time.perf_counter() + args.warmup
+        await asyncio.gather(
+            *(worker(workload, deadline, None) for _ in range(args.concurrency))
+        )
+        samples = {}
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                worker(workload, start + args.duration, samples)
+                for _ in range(args.concurrency)
+            )
+        )
+        return report.summarize(samples, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="load a running app instead of an in-process one")
+    parser.add_argument(
+        "--board", action="append", help="board to load, repeatable (default: all)"
+    )
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds")
+    parser.add_argument("--files", type=int, default=20, help="files to create first")
+    parser.add_argument(
+        "--s3-latency", type=float, default=0.005, help="in-memory s3 delay, seconds"
+    )
+    parser.add_argument("--save", help="write the results to this json file")
+    parser.add_argument("--baseline", help="compare with results saved by --save")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="allowed regression, 0.2 = 20%%"
+    )
+    parser.add_argument(
+        "--seed", type=int, help="seed of the operation mix (default: random)"
+    )
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randrange(2**32)
+    random.seed(seed)
+    summary = asyncio.run(run(args))
+    print(f"seed {seed}")
+    print(report.format_summary(summary))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"seed": seed, **summary}, f, indent=2)
+    if args.baseline:
+        regressions = report.compare(summary, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
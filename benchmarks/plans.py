@@ -0,0 +1,129 @@
+"""Check that the hot read queries never fall back to sequential scans.
+
+    python -m benchmarks.seed && python -m benchmarks.plans
+
+Every statement is built by the repositories themselves and run through
+EXPLAIN (FORMAT JSON); the exit status is non-zero if any plan scans one of
+the large tables sequentially. The planner only prefers index scans once the
+tables are big, so seed a realistic dataset first.
+"""
+
+import asyncio
+import json
+import sys
+
+import sqlalchemy
+from sqlalchemy.dialects import postgresql
+
+from app.db_schema import posts_table, threads_table
+from app.pagination import encode_cursor
+from app.repositories import FileRepo, PostRepo, ThreadRepo
+from app.resources import resources
+
+LARGE_TABLES = {
+    "thread",
+    "thread_summary",
+    "post",
+    "thread_media_file",
+    "post_media_file",
+    "media_blob",
+}
+
+
+def is_large(relation):
+    # thread_summary is partitioned by board
+    return relation in LARGE_TABLES or relation.startswith("thread_summary_")
+
+
+def seq_scans(plan):
+    if plan["Node Type"] == "Seq Scan" and is_large(plan["Relation Name"]):
+        yield plan["Relation Name"]
+    for subplan in plan.get("Plans", []):
+        yield from seq_scans(subplan)
+
+
+async def explain(conn, stmt):
+    sql = stmt.compile(
+        dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+    )
+    plan = (await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+async def sample_statements(conn, board):
+    thread_repo = ThreadRepo(resources)
+    middle_thread = (
+        await conn.execute(
+            sqlalchemy.Select(
+                threads_table.columns["id"], threads_table.columns["last_update"]
+            )
+            .where(threads_table.columns["board"] == board)
+            .order_by(threads_table.columns["last_update"].desc())
+            .offset(
+                sqlalchemy.Select(sqlalchemy.func.count() / 2)
+                .select_from(threads_table)
+                .where(threads_table.columns["board"] == board)
+                .scalar_subquery()
+            )
+            .limit(1)
+        )
+    ).one()
+    cursor = encode_cursor(middle_thread.last_update.isoformat(), middle_thread.id)
+    s3_filenames = (
+        await conn.execute(
+            sqlalchemy.Select(posts_table.columns["voice_message"])
+            .where(posts_table.columns["thread"] == middle_thread.id)
+            .limit(1000)
+        )
+    ).scalars()
+    middle_post = (
+        await conn.execute(
+            sqlalchemy.Select(sqlalchemy.func.min(posts_table.columns["id"])).where(
+                posts_table.columns["thread"] == middle_thread.id
+            )
+        )
+    ).scalar()
+    return {
+        "board page": thread_repo._get_threads_stmt(board, 20),
+        "board page (cursor)": thread_repo._get_threads_stmt(board, 20, cursor),
+        "thread": thread_repo._get_thread_stmt(board, middle_thread.id, 100),
+        "thread (after post)": thread_repo._get_thread_stmt(
+            board, middle_thread.id, 100, after_post_id=1
+        ),
+        "thread (last posts)": thread_repo._get_thread_stmt(
+            board, middle_thread.id, 100, last=True
+        ),
+        "search": thread_repo._search_threads_stmt(board, "thread 100", 20),
+        "search (cursor)": thread_repo._search_threads_stmt(
+            board, "thread 100", 20, encode_cursor(0.1, middle_thread.id)
+        ),
+        "referenced files": FileRepo(resources)._get_referenced_files_stmt(
+            list(s3_filenames)
+        ),
+        "voice metadata update": PostRepo(resources)._update_voice_metadata_stmt(
+            middle_post, {"duration": 1.0, "bitrate": 32, "waveform": [255]}
+        ),
+        "thumbnail update": FileRepo(resources)._set_thumbnail_stmt(
+            "image.jpg", "image_thumb.jpg"
+        ),
+    }
+
+
+async def check_plans(board="b"):
+    failed = False
+    async with resources["db_engine"].connect() as conn:
+        for name, stmt in (await sample_statements(conn, board)).items():
+            scanned = sorted(set(seq_scans(await explain(conn, stmt))))
+            if scanned:
+                failed = True
+                print(f"FAIL {name}: seq scan on {', '.join(scanned)}")
+            else:
+                print(f"ok   {name}")
+    await resources["db_engine"].dispose()
+    return not failed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(check_plans(*sys.argv[1:2])) else 1)
@@ -0,0 +1,69 @@
+"""Latency percentiles and throughput of a load run, and regression checks."""
+
+import json
+import math
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)]
+
+
+def summarize(samples, duration):
+    """Summarize ``{operation: [(latency seconds, ok)]}`` collected over ``duration``."""
+    samples = {
+        **dict(sorted(samples.items())),
+        "total": [result for results in samples.values() for result in results],
+    }
+    summary = {}
+    for operation, results in samples.items():
+        latencies = sorted(latency for latency, _ in results)
+        summary[operation] = {
+            "requests": len(results),
+            "errors": sum(not ok for _, ok in results),
+            "rps": len(results) / duration,
+            **{f"p{p}": percentile(latencies, p) * 1000 for p in PERCENTILES},
+        }
+    return summary
+
+
+def format_summary(summary):
+    header = f"{'operation':<16}{'requests':>10}{'errors':>8}{'req/s':>10}" + "".join(
+        f"{f'p{p} ms':>10}" for p in PERCENTILES
+    )
+    lines = [header]
+    for operation, stats in summary.items():
+        lines.append(
+            f"{operation:<16}{stats['requests']:>10}{stats['errors']:>8}"
+            f"{stats['rps']:>10.1f}"
+            + "".join(f"{stats[f'p{p}']:>10.1f}" for p in PERCENTILES)
+        )
+    return "\n".join(lines)
+
+
+def compare(summary, baseline_path, tolerance):
+    """Regressions beyond ``tolerance`` of a baseline.
+
+    p95 latency is compared per operation, throughput only in total, single
+    operations are too rare for a stable rate.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for operation, stats in summary.items():
+        if operation not in baseline:
+            continue
+        before = baseline[operation]
+        if stats["p95"] > before["p95"] * (1 + tolerance):
+            regressions.append(
+                f"{operation}: p95 {before['p95']:.1f} -> {stats['p95']:.1f} ms"
+            )
+        if operation == "total" and stats["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(
+                f"{operation}: {before['rps']:.1f} -> {stats['rps']:.1f} req/s"
+            )
+    return regressions
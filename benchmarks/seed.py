@@ -0,0 +1,86 @@
+"""Fill boards with synthetic threads, posts and media rows.
+
+    python -m benchmarks.seed --board b --threads 20000 --posts 10 --media 1
+
+Uses the database from the app config, so point POSTGRES_DB at a scratch
+database first.
+"""
+
+import argparse
+import asyncio
+
+import sqlalchemy
+from sqlalchemy.dialects.postgresql import insert
+
+from app.db_schema import boards_table
+from app.repositories import ThreadRepo
+from app.resources import resources
+
+SEED_STMT = sqlalchemy.text("""
+    WITH new_thread AS (
+        INSERT INTO thread (text, board, last_update)
+        SELECT 'thread ' || g, :board, now() - g * interval '1 second'
+        FROM generate_series(1, :threads) g
+        RETURNING id
+    ), new_thread_media AS (
+        INSERT INTO thread_media_file (thread, filename, s3_filename)
+        SELECT id, 'image.jpg', gen_random_uuid() || '.jpg'
+        FROM new_thread, generate_series(1, :media)
+        RETURNING s3_filename
+    ), new_post AS (
+        INSERT INTO post (thread, voice_message)
+        SELECT id, gen_random_uuid() || '.mp3'
+        FROM new_thread, generate_series(1, :posts)
+        RETURNING id, voice_message
+    ), new_post_media AS (
+        INSERT INTO post_media_file (post, filename, s3_filename)
+        SELECT id, 'image.jpg', gen_random_uuid() || '.jpg'
+        FROM new_post, generate_series(1, :media)
+        RETURNING s3_filename
+    )
+    INSERT INTO media_blob (key, ref_count)
+    SELECT s3_filename, 1 FROM new_thread_media
+    UNION ALL
+    SELECT voice_message, 1 FROM new_post
+    UNION ALL
+    SELECT s3_filename, 1 FROM new_post_media
+    """)
+
+
+async def seed(board="b", threads=20000, posts=10, media=1):
+    async with resources["db_engine"].begin() as conn:
+        await conn.execute(
+            insert(boards_table)
+            .values(slug=board, name=board)
+            .on_conflict_do_nothing(index_elements=["slug"])
+        )
+        await conn.execute(
+            SEED_STMT,
+            {"board": board, "threads": threads, "posts": posts, "media": media},
+        )
+        await conn.execute(ThreadRepo(resources)._summarize_threads_stmt(board))
+
+
+async def seed_boards(boards, threads, posts, media):
+    for board in boards:
+        await seed(board, threads, posts, media)
+    async with resources["db_engine"].connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.exec_driver_sql("ANALYZE")
+    await resources["db_engine"].dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--board", action="append", help="board to fill, repeatable (default: b)"
+    )
+    parser.add_argument("--threads", type=int, default=20000, help="threads per board")
+    parser.add_argument("--posts", type=int, default=10, help="posts per thread")
+    parser.add_argument("--media", type=int, default=1, help="media per thread/post")
+    args = parser.parse_args()
+    asyncio.run(seed_boards(args.board or ["b"], args.threads, args.posts, args.media))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import os
+
+# app.config reads these at import, the unit tests never connect
+for name in (
+    "POSTGRES_HOST",
+    "POSTGRES_PORT",
+    "POSTGRES_USER",
+    "POSTGRES_PASSWORD",
+    "POSTGRES_DB",
+    "S3_ACCESS_KEY_ID",
+    "S3_URL",
+    "S3_SECRET_ACCESS_KEY",
+):
+    os.environ.setdefault(name, "test")
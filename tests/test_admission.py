@@ -0,0 +1,59 @@
+import pytest
+
+from app import admission
+from app.admission import TokenBuckets
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, "monotonic", clock)
+    return clock
+
+
+def test_burst(clock):
+    buckets = TokenBuckets(rate=1, burst=3)
+    assert [buckets.take("a") for _ in range(3)] == [0, 0, 0]
+    assert buckets.take("a") == pytest.approx(1)
+
+
+def test_keys_are_separate(clock):
+    buckets = TokenBuckets(rate=1, burst=1)
+    assert buckets.take("a") == 0
+    assert buckets.take("b") == 0
+    assert buckets.take("a") > 0
+
+
+def test_refill(clock):
+    buckets = TokenBuckets(rate=2, burst=2)
+    buckets.take("a")
+    buckets.take("a")
+    assert buckets.take("a") == pytest.approx(0.5)
+    # the rejected take left the bucket as it was
+    clock.now += 0.5
+    assert buckets.take("a") == 0
+    assert buckets.take("a") == pytest.approx(0.5)
+
+
+def test_refill_stops_at_burst(clock):
+    buckets = TokenBuckets(rate=1, burst=2)
+    buckets.take("a")
+    clock.now += 60
+    assert [buckets.take("a") for _ in range(2)] == [0, 0]
+    assert buckets.take("a") == pytest.approx(1)
+
+
+def test_full_buckets_are_forgotten(clock):
+    buckets = TokenBuckets(rate=1, burst=1)
+    buckets.take("a")
+    clock.now += 1
+    buckets.take("b")
+    assert list(buckets._buckets) == ["b"]
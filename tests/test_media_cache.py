@@ -0,0 +1,93 @@
+import asyncio
+import os
+
+from app.media_cache import MediaCache, process_media_cache
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+def fill(cache, key, *parts):
+    async def read():
+        return b"".join([chunk async for chunk in cache.fill(key, chunks(*parts))])
+
+    return asyncio.run(read())
+
+
+def test_fill_passes_chunks_through(tmp_path):
+    cache = MediaCache(tmp_path, max_bytes=100)
+    assert fill(cache, "a.jpg", b"ab", b"cd") == b"abcd"
+    assert cache.get("a.jpg").read_bytes() == b"abcd"
+    assert cache.get("b.jpg") is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = MediaCache(tmp_path, max_bytes=30)
+    for key in ("a.jpg", "b.jpg", "c.jpg"):
+        fill(cache, key, b"x" * 10)
+    cache.get("a.jpg")
+    fill(cache, "d.jpg", b"x" * 10)
+    assert cache.get("b.jpg") is None
+    assert not (tmp_path / "b.jpg").exists()
+    for key in ("a.jpg", "c.jpg", "d.jpg"):
+        assert cache.get(key) is not None
+
+
+def test_size_bound(tmp_path):
+    cache = MediaCache(tmp_path, max_bytes=25)
+    for i in range(10):
+        fill(cache, f"{i}.jpg", b"x" * 10)
+        assert sum(f.stat().st_size for f in tmp_path.iterdir()) <= 25
+    assert sorted(f.name for f in tmp_path.iterdir()) == ["8.jpg", "9.jpg"]
+
+
+def test_object_over_the_bound_is_not_kept(tmp_path):
+    cache = MediaCache(tmp_path, max_bytes=10)
+    assert fill(cache, "a.jpg", b"x" * 11) == b"x" * 11
+    assert cache.get("a.jpg") is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_partial_read_is_not_kept(tmp_path):
+    cache = MediaCache(tmp_path, max_bytes=100)
+
+    async def read_first_chunk():
+        body = cache.fill("a.jpg", chunks(b"ab", b"cd"))
+        await body.__anext__()
+        await body.aclose()
+
+    asyncio.run(read_first_chunk())
+    assert cache.get("a.jpg") is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_keys_outside_the_directory_are_not_kept(tmp_path):
+    cache = MediaCache(tmp_path / "cache", max_bytes=100)
+    fill(cache, "../a.jpg", b"ab")
+    fill(cache, ".a.jpg", b"ab")
+    assert list(tmp_path.glob("**/*.jpg")) == []
+
+
+def test_reloads_in_access_order(tmp_path):
+    for i, key in enumerate(("b.jpg", "a.jpg")):
+        (tmp_path / key).write_bytes(b"x" * 10)
+        os.utime(tmp_path / key, (1000 + i, 1000 + i))
+    (tmp_path / ".partial").write_bytes(b"x")
+    cache = MediaCache(tmp_path, max_bytes=20)
+    assert not (tmp_path / ".partial").exists()
+    fill(cache, "c.jpg", b"x" * 10)
+    assert cache.get("b.jpg") is None
+    assert cache.get("a.jpg") is not None
+
+
+def test_process_media_cache(tmp_path):
+    # pids never go over 2 ** 22
+    (tmp_path / str(2**22 + 1)).mkdir()
+    (tmp_path / "other").mkdir()
+    cache = process_media_cache(tmp_path, max_bytes=100)
+    assert cache.directory == tmp_path / str(os.getpid())
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        [str(os.getpid()), "other"]
+    )
@@ -0,0 +1,90 @@
+import pytest
+
+from app import page_cache
+from app.page_cache import PageCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(page_cache.time, "monotonic", clock)
+    return clock
+
+
+def test_get_returns_what_was_set(clock):
+    cache = PageCache(ttl=5, max_pages=10)
+    etag, body = cache.set("b", 0, b"page", cache.version("b"))
+    assert body == b"page"
+    assert cache.get("b", 0) == (etag, b"page")
+    assert cache.get("b", 1) is None
+    assert cache.get("c", 0) is None
+
+
+def test_etag_follows_the_body(clock):
+    cache = PageCache(ttl=5, max_pages=10)
+    etag, _ = cache.set("b", 0, b"page", 0)
+    assert etag.startswith('"') and etag.endswith('"')
+    assert cache.set("c", 0, b"page", 0)[0] == etag
+    assert cache.set("b", 0, b"other page", 0)[0] != etag
+
+
+def test_invalidate(clock):
+    cache = PageCache(ttl=5, max_pages=10)
+    cache.set("b", 0, b"page", cache.version("b"))
+    cache.set("c", 0, b"page", cache.version("c"))
+    cache.invalidate("b")
+    assert cache.get("b", 0) is None
+    assert cache.get("c", 0) is not None
+
+
+def test_page_read_before_a_write_is_not_cached(clock):
+    cache = PageCache(ttl=5, max_pages=10)
+    version = cache.version("b")
+    cache.invalidate("b")
+    etag, body = cache.set("b", 0, b"stale page", version)
+    assert body == b"stale page"
+    assert cache.get("b", 0) is None
+
+
+def test_expires(clock):
+    cache = PageCache(ttl=5, max_pages=10)
+    cache.set("b", 0, b"page", 0)
+    clock.now += 4
+    assert cache.get("b", 0) is not None
+    clock.now += 2
+    assert cache.get("b", 0) is None
+
+
+def test_max_pages(clock):
+    cache = PageCache(ttl=5, max_pages=2)
+    for page in range(3):
+        cache.set("b", page, b"page", 0)
+    assert cache.get("b", 0) is None
+    assert cache.get("b", 1) is not None
+    assert cache.get("b", 2) is not None
+
+
+def test_invalidated_within(clock):
+    cache = PageCache(ttl=5, max_pages=10)
+    assert not cache.invalidated_within("b", 5)
+    cache.invalidate("b")
+    clock.now += 4
+    assert cache.invalidated_within("b", 5)
+    clock.now += 2
+    assert not cache.invalidated_within("b", 5)
+
+
+def test_clear(clock):
+    cache = PageCache(ttl=5, max_pages=10)
+    cache.set("b", 0, b"page", 0)
+    cache.clear()
+    assert cache.get("b", 0) is None
+    assert cache.version("b") == 1
@@ -0,0 +1,36 @@
+import pytest
+
+from app.exceptions import InvalidCursor
+from app.pagination import decode_cursor, encode_cursor
+
+
+def test_round_trip():
+    cursor = encode_cursor("2026-10-17T12:00:00+00:00", 42)
+    assert decode_cursor(cursor, 2) == ["2026-10-17T12:00:00+00:00", 42]
+
+
+def test_url_safe():
+    cursor = encode_cursor("?" * 10, 0.1)
+    assert "=" not in cursor
+    assert set(cursor) <= set(
+        "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+    )
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "",
+        "!!!",
+        "a",
+        encode_cursor(1),
+        encode_cursor(1, 2, 3),
+        # valid base64 of json that isn't a list
+        "eyJhIjoxfQ",
+        # valid base64 of something that isn't json
+        "bm90IGpzb24",
+    ],
+)
+def test_rejects_bad_cursors(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, 2)
@@ -0,0 +1,37 @@
+import pytest
+
+from app.uploads import SNIFF_BYTES, sniff
+
+JPEG = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01"
+PNG = b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR"
+ID3 = b"ID3\x04\x00\x00\x00\x00\x00\x0a\x00\x00\x00\x00\x00\x00"
+MP3_FRAME = b"\xff\xfb\x90\x00" + b"\x00" * 12
+
+
+@pytest.mark.parametrize(
+    "head, media_type",
+    [
+        (JPEG, "image/jpeg"),
+        (PNG, "image/x-png"),
+        (ID3, "audio/mpeg"),
+        (MP3_FRAME, "audio/mpeg"),
+    ],
+)
+def test_matches(head, media_type):
+    assert len(head) == SNIFF_BYTES
+    assert sniff(head, media_type)
+
+
+@pytest.mark.parametrize(
+    "head, media_type",
+    [
+        (PNG, "image/jpeg"),
+        (JPEG, "image/x-png"),
+        (JPEG, "audio/mpeg"),
+        (b"", "image/jpeg"),
+        (b"\x00" * SNIFF_BYTES, "audio/mpeg"),
+        (JPEG, "text/html"),
+    ],
+)
+def test_mismatches(head, media_type):
+    assert not sniff(head, media_type)
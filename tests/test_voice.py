@@ -0,0 +1,59 @@
+import pytest
+
+from app.voice import parse_header, parse_voice
+
+# mpeg1 layer III, no crc, 128 kbps, 44100 Hz, stereo
+HEADER = b"\xff\xfb\x90\x00"
+FRAME_LENGTH = 417
+
+
+def frame(audio_bits=0):
+    """A frame whose first granule carries ``audio_bits`` of audio."""
+    # part2_3_length follows 20 bits of main_data_begin, private bits and scfsi
+    side_info = (audio_bits << 256 - 20 - 12).to_bytes(32, "big")
+    return (HEADER + side_info).ljust(FRAME_LENGTH, b"\0")
+
+
+def test_parse_header():
+    header = parse_header(HEADER)
+    assert header.version == "mpeg1"
+    assert header.bitrate == 128
+    assert header.sample_rate == 44100
+    assert header.length == FRAME_LENGTH
+    assert header.channels == 2
+    assert not header.crc
+
+
+def test_valid():
+    data = frame(200) * 2 + frame(1000) * 2
+    voice = parse_voice(data, 2)
+    assert voice["duration"] == pytest.approx(4 * 1152 / 44100)
+    assert voice["bitrate"] == 128
+    assert voice["waveform"] == [51, 255]
+
+
+def test_waveform_has_up_to_peaks_values():
+    assert len(parse_voice(frame(1) * 10, 64)["waveform"]) == 10
+    assert len(parse_voice(frame(1) * 100, 64)["waveform"]) == 64
+
+
+def test_silence_is_flat():
+    assert parse_voice(frame() * 3, 64)["waveform"] == [0, 0, 0]
+
+
+def test_skips_id3_tag():
+    tag = b"ID3\x04\x00\x00\x00\x00\x00\x0a" + HEADER + b"\0" * 6
+    voice = parse_voice(tag + frame(1) * 2, 64)
+    assert voice["duration"] == pytest.approx(2 * 1152 / 44100)
+
+
+def test_truncated():
+    data = frame(1) * 3
+    voice = parse_voice(data[:-100], 64)
+    assert voice["duration"] == pytest.approx(2 * 1152 / 44100)
+
+
+def test_frameless():
+    assert parse_voice(b"", 64) is None
+    assert parse_voice(b"\0" * 10000, 64) is None
+    assert parse_voice(HEADER + b"\0" * 100, 64) is None